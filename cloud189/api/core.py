@@ -4,19 +4,36 @@
 
 import os
 import re
+import sys
 import json
+import zlib
+import tarfile
+import hashlib
 import simplejson
-from time import sleep
+from time import sleep, monotonic
+from threading import Lock
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from xml.etree import ElementTree
 import requests
 from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
 from urllib3 import disable_warnings
-from urllib3.exceptions import InsecureRequestWarning
+from urllib3.exceptions import InsecureRequestWarning, HTTPError as Urllib3Error
 
 from cloud189.api.utils import *
 from cloud189.api.types import *
 from cloud189.api.models import *
+from cloud189.api.journal import DownJournal
+from cloud189.api.writer import FileWriter, has_enough_space
+from cloud189.api.limiter import up_limiter, down_limiter
+from cloud189.api.resolver import UrlResolver, DownLink
+from cloud189.api.unzip import ZipStreamExtractor
+from cloud189.api.mirror import MirrorManifest
+from cloud189.api.multipart import MultipartUpload
+from cloud189.api.store import up_state_store
+from cloud189.api.hasher import HashPipeline
+from cloud189.api.pack import PACK_SUFFIX, TarPackReader, TarUnpacker, folder_size
 
 __all__ = ['Cloud189']
 
@@ -38,11 +55,17 @@ class Cloud189(object):
     UP_UNKNOWN_ERROR = 12  # 创建上传任务未知错误
     UP_EXHAUSTED_ERROR = 13  # 上传量用完
     UP_ILLEGAL_ERROR = 14  # 文件非法
+    DOWN_SPACE_ERROR = 15  # 磁盘空间不足
+    DOWN_MD5_ERROR = 16  # 下载文件 md5 校验失败
+
+    WEB_UP_TTL = 1800  # 网页接口上传地址、sessionKey 的缓存时间(秒)
+    STREAM_ERRORS = (requests.RequestException, Urllib3Error, OSError)  # 读取响应体、写入文件时的错误(连接中断、超时等)
 
     def __init__(self):
         self._session = requests.Session()
         self._captcha_handler = None
         self._timeout = 15  # 每个请求的超时(不包含下载响应体的用时)
+        self._up_parts = 1  # 大文件同时上传的分片数，1 表示不分片(分片上传需要手动开启)
         self._host_url = 'https://cloud.189.cn'
         self._auth_url = 'https://open.e.189.cn/api/logbox/oauth2/'
         self._cookies = None
@@ -54,6 +77,9 @@ class Cloud189(object):
             'Referer': 'https://open.e.189.cn/',
             'Accept': 'application/json;charset=UTF-8',
         }
+        self._resolver = UrlResolver(self)  # 下载直链缓存
+        self._web_up_info = None  # 网页接口上传缓存 (上传地址, sessionKey, 过期时间)
+        self._web_up_lock = Lock()
         disable_warnings(InsecureRequestWarning)  # 全局禁用 SSL 警告
 
     def _get(self, url, **kwargs):
@@ -80,11 +106,29 @@ class Cloud189(object):
         except (requests.RequestException, Exception) as e:
             logger.error(f"Unexpected error: {e=}")
 
+    def _head(self, url, **kwargs):
+        try:
+            kwargs.setdefault('timeout', self._timeout)
+            kwargs.setdefault('headers', self._headers)
+            kwargs.setdefault('allow_redirects', True)
+            return self._session.head(url, verify=False, **kwargs)
+        except requests.Timeout:
+            logger.warning(
+                "Encountered timeout error while requesting network!")
+            raise TimeoutError
+        except (requests.RequestException, Exception) as e:
+            logger.error(f"Unexpected error: {e=}")
+
     def set_session(self, key, secret, token):
+        self._invalidate_web_upload_info()
         self._sessionKey = key
         self._sessionSecret = secret
         self._accessToken = token
 
+    def set_upload_parts(self, parts):
+        """设置大文件同时上传的分片数，1 表示不分片(默认)；分片失败时自动改为顺序上传"""
+        self._up_parts = max(int(parts), 1)
+
     def set_captcha_handler(self, captcha_handler):
         """设置下载验证码处理函数
         :param captcha_handler (img_data) -> str 参数为图片二进制数据,需返回验证码字符
@@ -118,6 +162,7 @@ class Cloud189(object):
         """使用 cookie 登录"""
         cookies = config if isinstance(config, dict) else config.cookie
         try:
+            self._invalidate_web_upload_info()
             for k, v in cookies.items():
                 self._session.cookies.set(k, v, domain=".cloud.189.cn")
             resp = self._get(self._host_url + "/v2/getUserLevelInfo.action")
@@ -171,6 +216,7 @@ class Cloud189(object):
         r = self._post(url, data=data)
         msg = r.json()["msg"]
         if msg == "登录成功":
+            self._invalidate_web_upload_info()
             self._get(r.json()["toUrl"])
             return Cloud189.SUCCESS
         print(msg)
@@ -383,8 +429,9 @@ class Cloud189(object):
             durl = item['downloadUrl'] if 'downloadUrl' in item else ''
             isFolder = item['isFolder']
             isStarred = item['isStarred']
+            md5 = item['md5'] if 'md5' in item else ''
             file_list.append(FileInfo(name=name, id=id_, pid=pid, ctime=ctime, optime=optime, size=size,
-                                      ftype=ftype, durl=durl, isFolder=isFolder, isStarred=isStarred))
+                                      ftype=ftype, durl=durl, isFolder=isFolder, isStarred=isStarred, md5=md5))
         for item in path:
             path_list.append(PathInfo(name=item['fileName'], id=int(item['fileId']),
                                       isCoShare=item['isCoShare']))
@@ -392,10 +439,20 @@ class Cloud189(object):
         return file_list, path_list
 
 
-    def get_file_list(self, fid) -> (FileList):
-        """获取文件列表"""
+    def get_file_list(self, fid, with_path=True) -> (FileList, PathList):
+        """获取文件列表
+        :param with_path: 是否查询文件夹路径，递归遍历时不需要
+        """
+        code, file_list = self._list_folder(fid)
+        if code != Cloud189.SUCCESS or not with_path:
+            return file_list, PathList()
+        return file_list, self.get_file_path_list(fid)
+
+    def _list_folder(self, fid) -> (int, FileList):
+        """获取文件列表，区分列出失败与空文件夹
+        :return: Cloud189 状态码, FileList(失败时为空)
+        """
         file_list = FileList()
-        path_list = PathList()
         page = 1
         data = []
         url = self._host_url + "/api/open/file/listFiles.action"
@@ -410,19 +467,22 @@ class Cloud189(object):
                 "mediaType": 0,
                 "noCache": "0.10860476256694767"
             }
-            resp = self._get(url, params=params)
+            try:
+                resp = self._get(url, params=params)
+            except TimeoutError:
+                resp = None
             if not resp:
                 logger.error(f"File list: {fid=}network error!")
-                return file_list, path_list
+                return Cloud189.NETWORK_ERROR, file_list
             try:
                 resp = resp.json()
             except (json.JSONDecodeError, simplejson.errors.JSONDecodeError):
                 # 如果 fid 文件夹被删掉，resp 是 200 但是无法使用 json 方法
                 logger.error(f"File list: {fid=} not exit")
-                return file_list, path_list
+                return Cloud189.ID_ERROR, file_list
             if 'errorCode' in resp:
                 logger.error(f"Get file: {resp}")
-                return file_list, path_list
+                return Cloud189.FAILED, file_list
             resp = resp["fileListAO"]
             done = self._get_more_page(resp, pageNum=page, pageSize=60)
             data.extend(resp["folderList"])
@@ -443,11 +503,12 @@ class Cloud189(object):
             durl = ''
             isFolder = 'fileCount' in item
             isStarred = ''
+            md5 = item['md5'] if 'md5' in item else ''
 
             file_list.append(FileInfo(name=name, id=id_, pid=pid, ctime=ctime, optime=optime, size=size,
-                                      ftype=ftype, durl=durl, isFolder=isFolder, isStarred=isStarred))
+                                      ftype=ftype, durl=durl, isFolder=isFolder, isStarred=isStarred, md5=md5))
 
-        return file_list, self.get_file_path_list(fid)
+        return Cloud189.SUCCESS, file_list
 
     def get_file_path_list(self, fid) -> (PathList):
         path_list = PathList()
@@ -487,7 +548,8 @@ class Cloud189(object):
                 "baseFileId": "",
                 "fileName": up_info.name,
                 "size": up_info.size,
-                "md5": get_file_md5(up_info.path, up_info.check),
+                "md5": up_info.md5 or (up_info.stream.md5() if up_info.stream else
+                                       get_file_md5(up_info.path, up_info.check)),
                 "lastWrite": "",
                 "localPath": up_info.path,
                 "opertype": 1,
@@ -524,8 +586,10 @@ class Cloud189(object):
             logger.error(f'Upload by client [create]: an error occurred! {e=}')
         return code, infos
 
-    def _upload_file_data(self, file_upload_url, upload_file_id, up_info: UpInfo):
-        """客户端接口上传文件数据"""
+    def _upload_file_data(self, file_upload_url, upload_file_id, up_info: UpInfo, offset=0):
+        """客户端接口上传文件数据
+        :param offset: 服务器已经接收的字节数，从该位置继续上传
+        """
         url = f"{file_upload_url}?{SUFFIX_PARAM}"
         date = get_time()
         headers = {
@@ -536,40 +600,104 @@ class Cloud189(object):
             "Signature": calculate_hmac_sign(self._sessionSecret, self._sessionKey, 'PUT', url, date),
             "Accept": "application/json;charset=UTF-8",
             "Content-Type": "application/octet-stream",
-            "Edrive-UploadFileRange": f"0-{up_info.size}",
+            "Edrive-UploadFileRange": f"{offset}-{up_info.size}",
             "ResumePolicy": "1"
         }
 
-        self._upload_finished_flag = False  # 上传完成的标志
-
-        def _call_back(it, chunk_size):
-            for chunk_now, item in enumerate(it):
+        def _call_back(it):
+            now_size = offset
+            for item in it:
                 yield item
-                if up_info.callback:
-                    now_size = chunk_now * chunk_size
-                    if not self._upload_finished_flag:
-                        up_info.callback(up_info.path, up_info.size, now_size)
-                    if now_size == up_info.size:
-                        self._upload_finished_flag = True
+                now_size += len(item)
+                if up_info.callback and now_size < up_info.size:
+                    up_info.callback(up_info.path, up_info.size, now_size)
             if up_info.callback:  # 保证迭代完后，两者大小一样
                 up_info.callback(up_info.path, up_info.size, up_info.size)
 
-        chunk_size = get_chunk_size(up_info.size)
-        with open(up_info.path, 'rb') as f:
-            chunks = get_upload_chunks(f, chunk_size)
-            post_data = _call_back(chunks, chunk_size)
-
-            resp = requests.put(url, data=post_data, headers=headers, verify=False, timeout=None)
-            if resp.text != "":
-                node = ElementTree.XML(resp.text)
-                if node.text == "error":
-                    if node.findtext('code') != 'UploadFileCompeletedError':
-                        logger.error(
-                            f"Upload by client [data]: an error occurred while uploading data {node.findtext('code')},{node.findtext('message')}")
-                        return Cloud189.FAILED
-            else:
-                logger.debug(f"Upload by client [data]: upload {up_info.path} success!")
-                return Cloud189.SUCCESS
+        sizer = ChunkSizer(up_info.size - offset, up_info.name, up_limiter)  # 根据上传速度调整块大小
+        with up_info.stream or open(up_info.path, 'rb') as f:
+            f.seek(offset)
+            post_data = _call_back(sizer.iter_file(f))
+
+            try:
+                resp = requests.put(url, data=post_data, headers=headers, verify=False, timeout=None)
+            except requests.RequestException as e:  # 上传任务保存在本地，下次从服务器已接收的位置继续
+                logger.error(f"Upload by client [data]: {up_info.path} interrupted at {offset=}, {e=}")
+                return Cloud189.FAILED
+            return self._check_upload_data_resp(resp, up_info.path)
+
+    @staticmethod
+    def _check_upload_data_resp(resp, path) -> int:
+        """检查客户端接口上传数据的响应"""
+        if resp.text != "":
+            node = ElementTree.XML(resp.text)
+            if node.text == "error" or node.tag == "error":
+                if node.findtext('code') != 'UploadFileCompeletedError':
+                    logger.error(
+                        f"Upload by client [data]: an error occurred while uploading data {node.findtext('code')},{node.findtext('message')}")
+                    return Cloud189.FAILED
+        logger.debug(f"Upload by client [data]: upload {path} success!")
+        return Cloud189.SUCCESS
+
+    def _upload_part_data(self, session, file_upload_url, upload_file_id, start, end, md5, data) -> bool:
+        """客户端接口上传一个分片 [start, end)
+        :param md5: 分片数据 md5 的 base64 编码，服务器用于校验分片
+        """
+        url = f"{file_upload_url}?{SUFFIX_PARAM}"
+        date = get_time()
+        headers = {
+            "SessionKey": self._sessionKey,
+            "Edrive-UploadFileId": str(upload_file_id),
+            "User-Agent": UA,
+            "Date": date,
+            "Signature": calculate_hmac_sign(self._sessionSecret, self._sessionKey, 'PUT', url, date),
+            "Accept": "application/json;charset=UTF-8",
+            "Content-Type": "application/octet-stream",
+            "Content-MD5": md5,
+            "Edrive-UploadFileRange": f"{start}-{end}",
+            "ResumePolicy": "1"
+        }
+        try:
+            resp = session.put(url, data=data, headers=headers, verify=False, timeout=(self._timeout, 60))
+            if resp.status_code >= 400:
+                logger.debug(f"Upload by client [part]: {start=}, {end=}, {resp.status_code=}")
+                return False
+            return self._check_upload_data_resp(resp, f"{url} {start}-{end}") == Cloud189.SUCCESS
+        except (requests.RequestException, ElementTree.ParseError) as e:
+            logger.debug(f"Upload by client [part]: {start=}, {end=}, {e=}")
+            return False
+
+    def _get_upload_file_status(self, upload_file_id) -> (int, int, bool):
+        """查询未完成的上传任务
+        :return: Cloud189 状态码, 服务器已接收的字节数, 文件数据是否已经完整
+        """
+        try:
+            url = API + f"/getUploadFileStatus.action?{SUFFIX_PARAM}"
+            date = get_time()
+            headers = {
+                "SessionKey": self._sessionKey,
+                "Sign-Type": "1",
+                "User-Agent": UA,
+                "Date": date,
+                "Signature": calculate_hmac_sign(self._sessionSecret, self._sessionKey, 'GET', url, date),
+                "Accept": "application/json;charset=UTF-8",
+            }
+            params = {'uploadFileId': upload_file_id, 'resumePolicy': 1}
+            resp = requests.get(url, params=params, headers=headers, verify=False, timeout=10)
+            if not resp:
+                logger.debug(f"Upload by client [status]: {upload_file_id=}, {resp.status_code=}")
+                return Cloud189.FAILED, 0, False
+            resp = resp.json()
+            if 'size' not in resp:
+                logger.debug(f"Upload by client [status]: unknown response {resp=}")
+                return Cloud189.FAILED, 0, False
+            size = int(resp['size'])
+            data_exists = resp.get('fileDataExists') == 1
+            logger.debug(f"Upload by client [status]: {upload_file_id=}, {size=}, {data_exists=}")
+            return Cloud189.SUCCESS, size, data_exists
+        except Exception as e:
+            logger.error(f'Upload by client [status]: an error occurred! {e=}')
+            return Cloud189.FAILED, 0, False
 
     def _upload_client_commit(self, file_commit_url, upload_file_id):
         """客户端接口上传确认"""
@@ -609,11 +737,26 @@ class Cloud189(object):
         :param up_info: UpInfo
         :return:        UpCode
         """
-        if up_info.callback and up_info.check:
-            up_info.callback(up_info.path, 1, 0, 'check')
         quick_up = False
         fid = ''
-        code, infos = self._create_upload_file(up_info)
+        offset = 0
+        infos = tuple()
+        state_key = None if up_info.stream else up_state_store.key(up_info.path, up_info.fid)  # 打包的数据不续传
+        state = up_state_store.get(state_key) if state_key else None
+        if state:  # 续传未完成的上传任务，不需要重新计算 md5
+            code, offset, _ = self._get_upload_file_status(state['upload_file_id'])
+            if code == Cloud189.SUCCESS and offset <= up_info.size:
+                logger.debug(f"Upload by client: [{up_info.path}] resume from {offset=}")
+                infos = (state['upload_file_id'], state['upload_url'], state['commit_url'], 0)
+            else:  # 任务已经失效
+                up_state_store.remove(state_key)
+                offset = 0
+        if not infos:
+            if up_info.callback and up_info.check:
+                up_info.callback(up_info.path, 1, 0, 'check')
+            code, infos = self._create_upload_file(up_info)
+            if code == Cloud189.SUCCESS and infos[3] != 1 and state_key:
+                up_state_store.put(state_key, *infos[:3])
         if code == Cloud189.SUCCESS:
             upload_file_id, file_upload_url, file_commit_url, file_data_exists = infos
             if file_data_exists == 1:  # 数据存在，进入秒传流程
@@ -627,10 +770,26 @@ class Cloud189(object):
                     code = Cloud189.UP_COMMIT_ERROR
             else:  # 上传文件数据
                 logger.debug(f"Upload by client: [{up_info.path}] enter the normal upload process...")
-                code = self._upload_file_data(file_upload_url, upload_file_id, up_info)
+                if offset >= up_info.size > 0:  # 服务器已经接收全部数据
+                    code = Cloud189.SUCCESS
+                elif (up_info.size - offset > MultipartUpload.PART_SIZE and self._up_parts > 1
+                      and not up_info.stream):  # 大文件分片并行上传
+                    multipart = MultipartUpload(self, file_upload_url, upload_file_id, up_info,
+                                                self._up_parts, offset)
+                    if multipart.upload():
+                        code = Cloud189.SUCCESS
+                    else:  # 分片被拒绝时，从服务器已接收的位置顺序上传剩余数据
+                        status, acked, _ = self._get_upload_file_status(upload_file_id)
+                        offset = min(acked, up_info.size) if status == Cloud189.SUCCESS else offset
+                        logger.debug(f"Upload by client: [{up_info.path}] multipart failed, fall back from {offset=}")
+                        code = self._upload_file_data(file_upload_url, upload_file_id, up_info, offset)
+                else:
+                    code = self._upload_file_data(file_upload_url, upload_file_id, up_info, offset)
                 if code == Cloud189.SUCCESS:
                     call_back_msg = None
                     fid = self._upload_client_commit(file_commit_url, upload_file_id)
+                    if fid and state_key:
+                        up_state_store.remove(state_key)
                 else:
                     call_back_msg = 'error'
                     logger.debug(f"Upload by client: [{up_info.path}] normal upload failed!")
@@ -645,24 +804,41 @@ class Cloud189(object):
             up_info.callback(up_info.path, 1, 1, call_back_msg)
         return UpCode(code=code, id=fid, quick_up=quick_up, path=up_info.path)
 
-    def _upload_file_by_web(self, up_info: UpInfo) -> UpCode:
-        """使用网页接口上传单文件，不支持秒传
-        :param up_info: UpInfo
-        :return:         UpCode
+    def _get_web_upload_info(self, path='') -> (int, str, str):
+        """网页接口上传前获取上传地址与 sessionKey
+        结果缓存 WEB_UP_TTL 秒，批量上传时只请求一次，上传失败(如登录失效)时由 _invalidate_web_upload_info 清除
+        :param path: 调试日志中显示的上传文件
+        :return: 状态码, 上传地址, sessionKey
         """
+        with self._web_up_lock:  # 多个文件同时上传时只请求一次
+            if self._web_up_info and self._web_up_info[2] > monotonic():
+                return Cloud189.SUCCESS, self._web_up_info[0], self._web_up_info[1]
+            code, upload_url, sessionKey = self._fetch_web_upload_info(path)
+            if code == Cloud189.SUCCESS and upload_url:
+                self._web_up_info = (upload_url, sessionKey, monotonic() + self.WEB_UP_TTL)
+                logger.debug(f"Upload by web: cached upload info {upload_url=}")
+            return code, upload_url, sessionKey
+
+    def _invalidate_web_upload_info(self):
+        """清除网页接口上传缓存，下次上传重新获取"""
+        with self._web_up_lock:
+            if self._web_up_info:
+                logger.debug("Upload by web: upload info invalidated")
+            self._web_up_info = None
+
+    def _fetch_web_upload_info(self, path='') -> (int, str, str):
+        """请求上传地址，并从 main.action 页面解析 sessionKey"""
         headers = {'Referer': self._host_url}
         url = self._host_url + "/v2/getUserUploadUrl.action"
         resp = self._get(url, headers=headers)
         if not resp:
-            logger.error(f"Upload by web: [{up_info.path}] network error(1)!")
-            if up_info.callback:
-                up_info.callback(up_info.path, 1, 1, 'error')
-            return UpCode(code=Cloud189.NETWORK_ERROR, path=up_info.path)
+            logger.error(f"Upload by web: [{path}] network error(1)!")
+            return Cloud189.NETWORK_ERROR, '', ''
         resp = resp.json()
         if 'uploadUrl' in resp:
             upload_url = "https:" + resp['uploadUrl']
         else:
-            logger.error(f"Upload by web: [{up_info.path}] failed to obtain upload node!")
+            logger.error(f"Upload by web: [{path}] failed to obtain upload node!")
             upload_url = ''
 
         self._session.headers["Referer"] = self._host_url  # 放到 headers？
@@ -671,20 +847,39 @@ class Cloud189(object):
         url = self._host_url + "/main.action"
         resp = self._get(url, headers=headers)
         if not resp:
-            logger.error(f"Upload by web: [{up_info.path}] network error(2)!")
+            logger.error(f"Upload by web: [{path}] network error(2)!")
+            return Cloud189.NETWORK_ERROR, '', ''
+        sessionKey = re.search(r"sessionKey = '(.+?)'", resp.text)
+        if not sessionKey:  # 登录已经失效
+            logger.error(f"Upload by web: [{path}] sessionKey not found in main page!")
+            return Cloud189.FAILED, '', ''
+        return Cloud189.SUCCESS, upload_url, sessionKey.group(1)
+
+    def _upload_file_by_web(self, up_info: UpInfo) -> UpCode:
+        """使用网页接口上传单文件，不支持秒传
+        :param up_info: UpInfo
+        :return:         UpCode
+        """
+        code, upload_url, sessionKey = self._get_web_upload_info(up_info.path)
+        if code != Cloud189.SUCCESS:
             if up_info.callback:
                 up_info.callback(up_info.path, 1, 1, 'error')
-            return UpCode(code=Cloud189.NETWORK_ERROR, path=up_info.path)
-        sessionKey = re.findall(r"sessionKey = '(.+?)'", resp.text)[0]
+            return UpCode(code=code, path=up_info.path)
+
+        bytes_read = [0]  # 已经申请过限速额度的字节数
+
+        finished = [False]  # 上传完成的标志，每个文件单独记录，多个文件可以同时上传
 
         def _call_back(read_monitor):
+            up_limiter.consume(read_monitor.bytes_read - bytes_read[0])
+            bytes_read[0] = read_monitor.bytes_read
             if up_info.callback:
-                if not self._upload_finished_flag:
+                if not finished[0]:
                     up_info.callback(up_info.path, read_monitor.len, read_monitor.bytes_read)
                 if read_monitor.len == read_monitor.bytes_read:
-                    self._upload_finished_flag = True
+                    finished[0] = True
 
-        with open(up_info.path, 'rb') as file_:
+        with up_info.stream or open(up_info.path, 'rb') as file_:
             post_data = MultipartEncoder({
                 "parentId": up_info.fid,
                 "fname": up_info.name,
@@ -694,7 +889,6 @@ class Cloud189(object):
                 "upload_file": (up_info.name, file_, 'application/octet-stream')
             })
             headers = {"Content-Type": post_data.content_type}
-            self._upload_finished_flag = False  # 上传完成的标志
 
             monitor = MultipartEncoderMonitor(post_data, _call_back)
             result = self._post(upload_url, data=monitor, headers=headers, timeout=None)
@@ -705,47 +899,68 @@ class Cloud189(object):
                     call_back_msg = ''
                     fid = result['id']
                     code = Cloud189.SUCCESS
-                else:
+                else:  # 可能是 sessionKey 失效，下次重新获取
                     call_back_msg = 'error'
                     code = Cloud189.FAILED
                     logger.error(f"Upload by web: [{up_info.path}] failed, {result=}")
-            else:  # 网络异常
+                    self._invalidate_web_upload_info()
+            else:  # 网络异常或登录失效(4xx)
                 call_back_msg = 'error'
                 code = Cloud189.NETWORK_ERROR
                 logger.error(f"Upload by web: [{up_info.path}] network error(3)!")
+                self._invalidate_web_upload_info()
             if up_info.callback:
                 up_info.callback(up_info.path, 1, 1, call_back_msg)
             return UpCode(code=code, id=fid, path=up_info.path)
 
 
-    def _check_up_file_exist(self, up_info: UpInfo) -> UpInfo:
-        """检查文件是否已经存在"""
-        if not up_info.force:
-            files_info, _ = self.get_file_list(up_info.fid)
-            for file_info in files_info:
-                if up_info.name == file_info.name and up_info.size == file_info.size:
-                    logger.debug(f"Check file exist: {up_info.path} already exist! {file_info.id}")
-                    up_info = up_info._replace(id=file_info.id, exist=True)
-                    break
+    def _check_up_file_exist(self, up_info: UpInfo, index: FolderIndex = None) -> UpInfo:
+        """检查文件是否已经存在
+        :param index: 文件夹索引，批量上传时使用，避免每个文件都列出一次文件夹
+        """
+        if up_info.force:
+            return up_info
+        if index is not None:
+            file_id = index.find(up_info.fid, up_info.name, up_info.size)
+            if file_id is not None:
+                logger.debug(f"Check file exist: {up_info.path} already exist! {file_id}")
+                up_info = up_info._replace(id=file_id, exist=True)
+            return up_info
+        files_info, _ = self.get_file_list(up_info.fid, with_path=False)
+        for file_info in files_info:
+            if up_info.name == file_info.name and up_info.size == file_info.size:
+                logger.debug(f"Check file exist: {up_info.path} already exist! {file_info.id}")
+                up_info = up_info._replace(id=file_info.id, exist=True)
+                break
         return up_info
 
-    def upload_file(self, file_path, folder_id=-11, force=False, callback=None) -> UpCode:
+    def upload_file(self, file_path, folder_id=-11, force=False, callback=None, md5='', index=None,
+                    size=-1) -> UpCode:
         """单个文件上传接口
         :param str file_path: 待上传文件路径
         :param int folder_id: 上传目录 id
         :param bool force: 强制上传已经存在的文件(文件名、大小一致的文件)
         :param func callback: 上传进度回调
+        :param str md5: 已经计算好的文件 md5(大写)，为空时创建上传任务前计算
+        :param FolderIndex index: 目标文件夹索引，用于判断文件是否已经存在
+        :param int size: 遍历文件夹时已经得到的文件大小，-1 表示需要检查文件
         :return: UpCode
         """
-        if not os.path.isfile(file_path):
+        if size < 0 and not os.path.isfile(file_path):
             logger.error(f"Upload file: [{file_path}] is not a file!")
             return UpCode(code=Cloud189.PATH_ERROR, path=file_path)
 
         file_name = os.path.basename(file_path)
-        file_size = os.path.getsize(file_path)  # Byte
-        up_info = self._check_up_file_exist(UpInfo(name=file_name, path=file_path, size=file_size,
-                                                   fid=str(folder_id), force=force, callback=callback))
-        if not force and up_info.exist:
+        file_size = size if size >= 0 else os.path.getsize(file_path)  # Byte
+        up_info = UpInfo(name=file_name, path=file_path, size=file_size, fid=str(folder_id), force=force,
+                         callback=callback, md5=md5)
+        return self._upload(up_info, index)
+
+    def _upload(self, up_info: UpInfo, index: FolderIndex = None) -> UpCode:
+        """检查文件是否存在，选择客户端或网页接口上传"""
+        file_path, folder_id = up_info.path, up_info.fid
+        up_info = self._check_up_file_exist(up_info, index)
+        if not up_info.force and up_info.exist:
             logger.debug(f"Abandon upload because the file is already exist: {file_path=}")
             if up_info.callback:
                 up_info.callback(up_info.path, 1, 1, 'exist')
@@ -757,70 +972,306 @@ class Cloud189(object):
             logger.debug(f"Use the web interface to upload files: {file_path=}, {folder_id=}")
             return self._upload_file_by_web(up_info)
 
+    def upload_pack(self, folder_path, folder_id=-11, force=False, callback=None, index=None) -> UpCode:
+        """把文件夹打包成 tar 流上传，不生成临时文件，网盘中保存为 文件夹名.tar
+        适合大量小文件：只需要一次创建、上传、确认请求，使用 down_pack_by_id 下载时解包
+        :param str folder_path: 待打包上传的文件夹
+        :param int folder_id: 上传目录 id
+        :param bool force: 强制上传已经存在的文件(文件名、大小一致的文件)
+        :param func callback: 上传进度回调
+        :param FolderIndex index: 目标文件夹索引，用于判断文件是否已经存在
+        :return: UpCode
+        """
+        if not os.path.isdir(folder_path):
+            logger.error(f"Upload pack: [{folder_path}] is not a folder!")
+            return UpCode(code=Cloud189.PATH_ERROR, path=folder_path)
+        try:
+            pack = TarPackReader(folder_path)
+            up_info = UpInfo(name=get_file_name(folder_path) + PACK_SUFFIX, path=folder_path, size=pack.size,
+                             fid=str(folder_id), force=force, callback=callback, stream=pack)
+            return self._upload(up_info, index)
+        except OSError as e:  # 打包过程中文件被修改、删除
+            logger.error(f"Upload pack: [{folder_path}] failed, {e=}")
+            if callback:
+                callback(folder_path, 1, 1, 'error')
+            return UpCode(code=Cloud189.FAILED, path=folder_path)
+
+    def upload_stream(self, chunks, name, folder_id=-11, callback=None) -> UpCode:
+        """上传长度未知的数据流(如标准输入、边生成边上传的数据库备份)，数据不落本地磁盘
+        使用网页接口，请求体以 chunked 编码边读边发送，同时计算 md5，上传后与网盘中的文件核对
+        :param chunks: bytes 迭代器
+        :param str name: 网盘中的文件名
+        :param int folder_id: 上传目录 id
+        :param func callback: 上传进度回调 (文件名, -1, 已上传大小)
+        :return: UpCode
+        """
+        code, upload_url, sessionKey = self._get_web_upload_info(name)
+        if code != Cloud189.SUCCESS:
+            return UpCode(code=code, path=name)
+        boundary = os.urandom(16).hex()
+        fields = {"parentId": str(folder_id), "fname": name, "sessionKey": sessionKey,
+                  "albumId": "undefined", "opertype": "1"}
+        hash_md5 = hashlib.md5()
+        sent = [0]
+
+        def _body():
+            for key, value in fields.items():
+                yield f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode()
+            yield (f'--{boundary}\r\nContent-Disposition: form-data; name="upload_file"; filename="{name}"\r\n'
+                   f'Content-Type: application/octet-stream\r\n\r\n').encode()
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                hash_md5.update(chunk)
+                up_limiter.consume(len(chunk))
+                yield bytes(chunk)
+                sent[0] += len(chunk)
+                if callback:
+                    callback(name, -1, sent[0])
+            yield f'\r\n--{boundary}--\r\n'.encode()
+
+        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        result = self._post(upload_url, data=_body(), headers=headers, timeout=None)
+        md5 = hash_md5.hexdigest().upper()
+        logger.debug(f"Upload stream: {name=}, size={sent[0]}, {md5=}")
+        if not result:
+            logger.error(f"Upload stream: [{name}] network error!")
+            self._invalidate_web_upload_info()
+            return UpCode(code=Cloud189.NETWORK_ERROR, path=name)
+        result = result.json()
+        if 'id' not in result:
+            logger.error(f"Upload stream: [{name}] failed, {result=}")
+            self._invalidate_web_upload_info()
+            return UpCode(code=Cloud189.FAILED, path=name)
+        code, info = self.get_file_info_by_id(result['id'])
+        if code == Cloud189.SUCCESS and ((info.md5 and info.md5.upper() != md5)
+                                         or (info.size != '' and int(info.size) != sent[0])):
+            logger.error(f"Upload stream: [{name}] verify failed, {md5=}, size={sent[0]}, {info=}")
+            return UpCode(code=Cloud189.FAILED, id=result['id'], path=name)
+        if callback:
+            callback(name, sent[0], sent[0])
+        return UpCode(code=Cloud189.SUCCESS, id=result['id'], path=name)
+
+    def _make_level_folders(self, parents, index: FolderIndex, pool) -> dict:
+        """建立同一层的所有子文件夹，已经存在的文件夹直接使用
+        这一层的父文件夹通过索引并发列出(新建的文件夹不需要列出)，所有父文件夹中缺少的子文件夹一起并发创建
+        :param parents: [(父文件夹相对路径, 父文件夹 id, [本地子文件夹名])]
+        :param pool: 列出、创建文件夹使用的线程池
+        :return: {子文件夹相对路径: 文件夹 id}，创建失败的文件夹不在其中
+        """
+        def _existing(parent) -> dict:
+            try:
+                return index.folders(parent[1])
+            except Exception as e:  # 列出失败时全部走 mkdir，已存在的文件夹 mkdir 会返回它的 id
+                logger.error(f"Upload dir: list folder {parent[1]=} failed! {e=}")
+                return {}
+
+        def _mkdir(task) -> MkCode:
+            parent_id, name, _ = task
+            try:
+                return self.mkdir(parent_id, name)
+            except Exception as e:  # 超时等异常只算这个文件夹失败，不中断整个上传
+                logger.error(f"Upload dir: create folder {name=} in {parent_id=} error! {e=}")
+                return MkCode(Cloud189.MKDIR_ERROR)
+
+        dir_ids = {}
+        missing = []  # (父文件夹 id, 子文件夹名, 子文件夹相对路径)
+        for (rel_dir, parent_id, names), existing in zip(parents, pool.map(_existing, parents)):
+            for name in names:
+                rel_path = rel_dir + os.sep + name if rel_dir else name
+                if name in existing:
+                    dir_ids[rel_path] = existing[name]
+                else:
+                    missing.append((parent_id, name, rel_path))
+        reused = len(dir_ids)
+        for (parent_id, name, rel_path), result in zip(missing, pool.map(_mkdir, missing)):
+            if result.code != Cloud189.SUCCESS:
+                logger.error(f"Upload dir: create folder {name=} in {parent_id=} failed! {result=}")
+                continue
+            dir_ids[rel_path] = str(result.id)
+            index.seed(str(result.id), [])
+        logger.debug(f"Upload dir: level of {len(parents)=} folders, {reused=}, "
+                     f"created={len(missing)}, ready={len(dir_ids)}")
+        return dir_ids
+
     def upload_dir(self, folder_path, parrent_fid=-11, force=False, mkdir=True, callback=None,
-                   failed_callback=None, up_handler= None):
+                   failed_callback=None, up_handler=None, workers=3, hash_window=8, pack_size=0):
         """文件夹上传接口
         :param str file_path: 待上传文件路径
         :param int folder_id: 上传目录 id
         :param bool force: 强制上传已经存在的文件(文件名、大小一致的文件)
         :param bool mkdir: 是否在 parrent_fid 创建父文件夹
-        :param func callback: 上传进度回调
+        :param func callback: 上传进度回调，每个文件单独回调
         :param func failed_callback: 错误回调
-        :param func up_handler: 上传文件数回调
-        :return: UpCode list  or  Cloud189 error code(mkdir error)
+        :param func up_handler: 上传文件数回调 (已完成数, 已发现的文件总数, 正在上传数)
+        :param int workers: 同时上传的文件数
+        :param int hash_window: 提前计算 md5 的文件数(客户端接口秒传检查需要 md5)
+        :param int pack_size: 总大小不超过 pack_size 的子文件夹打包成 tar 上传(upload_pack)，0 表示不打包
+        :return: UpCode list(按遍历顺序)  or  Cloud189 error code(mkdir error)
         """
         if not os.path.isdir(folder_path):
             logger.error(f"Upload dir: [{folder_path}] is not a file")
             return UpCode(Cloud189.PATH_ERROR)
 
-        dir_dict = {}
         logger.debug(f'Upload dir: start parsing {folder_path=} structure...')
-        upload_files = []
         folder_name = get_file_name(folder_path)
         if mkdir:
             result = self.mkdir(parrent_fid, folder_name)
             if result.code != Cloud189.SUCCESS:
                 return result  # MkCode
-
-            dir_dict[folder_name] = result.id
+            root_id = result.id
         else:
-            dir_dict[folder_name] = parrent_fid
-
-        for home, dirs, files in os.walk(folder_path):
-            for _file in files:
-                f_path = home + os.sep + _file
-                f_rfolder = get_relative_folder(f_path, folder_path)
-                logger.debug(f"Upload dir: {f_rfolder=}, {f_path=}, {folder_path=}")
-                if f_rfolder not in dir_dict:
-                    dir_dict[f_rfolder] = ''
-                upload_files.append((f_path, dir_dict[f_rfolder]))
-            for _dir in dirs:
-                p_rfolder = get_relative_folder(
-                    home, folder_path, is_file=False)
-                logger.debug(f"Upload dir: {p_rfolder=}, {home=}, {folder_path=}")
-                dir_rname = p_rfolder + os.sep + _dir  # 文件夹相对路径
-
-                result = self.mkdir(dir_dict[p_rfolder], _dir)
-                if result.code != Cloud189.SUCCESS:
-                    logger.error(
-                        f"Upload dir: create a folder in the upload sub folder{dir_rname=} failed! {folder_name=}, {dir_dict[p_rfolder]=}")
-                    return result  # MkCode
-                logger.debug(
-                    f"Upload dir: folder successfully created {folder_name=}, {dir_dict[p_rfolder]=}, {dir_rname=}, {result.id}")
-                dir_dict[dir_rname] = result.id
-        up_codes = []
-        total_files = len(upload_files)
-        for index, upload_file in enumerate(upload_files, start=1):
-            if up_handler:
-                up_handler(index, total_files)
-            logger.debug(f"Upload dir: file [{upload_file[0]}] enter upload process...")
-            up_code = self.upload_file(upload_file[0], upload_file[1], force=force, callback=callback)
+            root_id = parrent_fid
+
+        index = FolderIndex(lambda fid: self.get_file_list(fid, with_path=False)[0])  # 每个目标文件夹只列出一次
+
+        def _local_files(mk_pool):
+            """边遍历边产生待上传文件
+            scan_dir 按层遍历，一层的文件夹都遍历完(文件已经产生)之后，再一起建立下一层的所有文件夹
+            """
+            prefix = folder_path.rstrip(os.sep) + os.sep
+            dir_ids = {'': str(root_id)}  # 本地相对路径 -> 网盘文件夹 id
+            parents = []  # 当前层等待建立子文件夹的 (相对路径, 文件夹 id, [子文件夹名])
+            for rel_dir, dirs, files in scan_dir(folder_path):
+                if rel_dir not in dir_ids and parents:  # 进入下一层
+                    dir_ids.update(self._make_level_folders(parents, index, mk_pool))
+                    for parent_dir, _, names in parents:
+                        for name in names:
+                            rel_path = parent_dir + os.sep + name if parent_dir else name
+                            if rel_path not in dir_ids and failed_callback:
+                                failed_callback(Cloud189.MKDIR_ERROR, prefix + rel_path)
+                    parents = []
+                if rel_dir not in dir_ids:  # 文件夹创建失败，已经报告过，不再进入
+                    dirs.clear()
+                    continue
+                fid = dir_ids[rel_dir]
+                for path, name, size, mtime in files:
+                    yield LocalFile(path=path, name=name, size=size, mtime=mtime, fid=fid)
+                if pack_size > 0:  # 小文件夹整个打包，不再进入
+                    for name in dirs[:]:
+                        path = prefix + (rel_dir + os.sep + name if rel_dir else name)
+                        if folder_size(path, pack_size) >= 0:
+                            dirs.remove(name)
+                            yield LocalFile(path=path, name=name + PACK_SUFFIX, size=-1, fid=fid, pack=True)
+                if dirs:
+                    parents.append((rel_dir, fid, list(dirs)))
+
+        lock = Lock()
+        counts = {'done': 0, 'running': 0, 'total': 0, 'saved': 0}
+        uploading = {}  # (大小, md5) -> [(LocalFile, md5)] 内容相同的文件正在上传，等待它提交后秒传
+        landed = set()  # 已经上传成功的 (大小, md5)
+        ready = deque()  # 等待的文件可以秒传了，重新提交
+
+        def _update_count(done, running, total=0):
+            with lock:
+                counts['done'] += done
+                counts['running'] += running
+                counts['total'] += total
+                if up_handler:
+                    up_handler(counts['done'], counts['total'], counts['running'])
+
+        def _need_hash(local_file) -> bool:
+            """只有需要上传的文件才计算 md5，网盘中已经存在(将被跳过)的文件不读取"""
+            if local_file.pack:
+                return False
+            return force or index.find(local_file.fid, local_file.name, local_file.size) is None
+
+        def _upload_one(local_file, md5=None):
+            """上传一个文件，与正在上传的文件内容相同时返回 None，等那个文件提交后再次提交"""
+            _update_count(0, 1)
+            logger.debug(f"Upload dir: file [{local_file.path}] enter upload process...")
+            key = None
+            try:
+                if md5 is None:
+                    md5 = hasher.get(local_file.path) if hasher and _need_hash(local_file) else ''
+                if md5 and local_file.size > 0:
+                    key = (local_file.size, md5)
+                    with lock:
+                        if key in uploading:  # 同一内容只有第一个文件上传数据
+                            uploading[key].append((local_file, md5))
+                            key = None
+                            counts['running'] -= 1
+                            logger.debug(f"Upload dir: [{local_file.path}] wait for the same content to land")
+                            return None
+                        if key not in landed:
+                            uploading[key] = []
+                        else:
+                            key = None
+                if local_file.pack:
+                    up_code = self.upload_pack(local_file.path, local_file.fid, force=force, callback=callback,
+                                               index=index)
+                else:
+                    up_code = self.upload_file(local_file.path, local_file.fid, force=force, callback=callback,
+                                               md5=md5, index=index, size=local_file.size)
+                if up_code.code == Cloud189.SUCCESS and up_code.id and not local_file.pack:
+                    index.add(local_file.fid, local_file.name, local_file.size, up_code.id)
+            except Exception as e:  # 单个文件出错不影响其它文件
+                logger.error(f"Upload dir: file [{local_file.path}] an error occurred! {e=}")
+                up_code = UpCode(code=Cloud189.FAILED, path=local_file.path)
+            finally:
+                if key is not None:  # 数据已经提交(或失败)，等待的文件重新提交，失败时由下一个文件上传数据
+                    with lock:
+                        if up_code.code == Cloud189.SUCCESS:
+                            landed.add(key)
+                        ready.extend(uploading.pop(key))
+            if up_code.quick_up and not local_file.pack:
+                with lock:
+                    counts['saved'] += local_file.size
             if failed_callback and up_code.code != Cloud189.SUCCESS:
                 failed_callback(up_code.code, up_code.path)
                 logger.debug(f"Up Dir Code: {up_code.code=}, {up_code.path=}")
-            up_codes.append(up_code)
-            logger.debug(f"Dir: {index=}, {total_files=}")
-        return up_codes
+            _update_count(1, -1)
+            return up_code
+
+        workers = max(workers, 1)
+        window = max(hash_window, workers)  # 已发现但还没有开始上传的文件数上限，内存占用与文件总数无关
+        hasher = None
+        if self._sessionKey and self._sessionSecret and self._accessToken and hash_window > 0:  # 客户端接口
+            hasher = HashPipeline([], window)
+        if up_handler:
+            up_handler(0, 0, 0)
+        results = []  # (遍历顺序, UpCode)
+        order = {}  # LocalFile -> 遍历顺序，上传结束前保留(等待秒传的文件会再次提交)
+        submitted = {}  # future -> LocalFile
+        waiting = deque()
+        running = set()
+        try:
+            with ThreadPoolExecutor(max_workers=8) as mk_pool, ThreadPoolExecutor(max_workers=workers) as pool:
+                local_files = _local_files(mk_pool)
+                exhausted = False
+                while True:
+                    while not exhausted and len(waiting) < window:
+                        local_file = next(local_files, None)
+                        if local_file is None:
+                            exhausted = True
+                            break
+                        order[local_file] = len(order) + len(results)
+                        waiting.append(local_file)
+                        _update_count(0, 0, 1)
+                        if hasher and _need_hash(local_file):
+                            hasher.add(local_file.path)
+                    while len(running) < workers:
+                        with lock:
+                            args = ready.popleft() if ready else None
+                        if args is None:
+                            if not waiting:
+                                break
+                            args = (waiting.popleft(),)
+                        future = pool.submit(_upload_one, *args)
+                        submitted[future] = args[0]
+                        running.add(future)
+                    if not running:
+                        break
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        local_file = submitted.pop(future)
+                        if future.result() is not None:  # None: 等待秒传，之后再次提交
+                            results.append((order.pop(local_file), future.result()))
+        finally:
+            if hasher:
+                hasher.close()
+        logger.debug(f"Upload dir: finished total={counts['total']}, {workers=}, saved={counts['saved']}")
+        return [up_code for _, up_code in sorted(results, key=lambda x: x[0])]  # 按遍历顺序返回
 
     def get_file_info_by_id(self, fid) -> (int, FileInfo):
         '''获取文件(夹) 详细信息'''
@@ -847,23 +1298,81 @@ class Cloud189(object):
         account = resp['createAccount']
         durl = resp['downloadUrl'] if 'downloadUrl' in resp else ''
         count = resp['subFileCount'] if 'subFileCount' in resp else ''
+        md5 = resp['md5'] if 'md5' in resp else ''
         return Cloud189.SUCCESS, FileInfo(name=name, id=id_, pid=pid, ctime=ctime, optime=optime,
                                           size=size, ftype=ftype, isFolder=isFolder, account=account,
-                                          durl=durl, count=count)
+                                          durl=durl, count=count, md5=md5)
 
-    def _down_one_link(self, durl, save_path, callback=None) -> int:
-        """下载器"""
+    @staticmethod
+    def _get_down_file_name(resp) -> str:
+        """从响应头 content-disposition 获取文件名"""
+        content_d = resp.headers.get('content-disposition', '').encode('latin-1').decode('utf-8')
+        file_name = re.search(r'filename="(.+)"', content_d)
+        return file_name.group(1) if file_name else ''
+
+    def _get_link(self, link: DownLink, head=False, **kwargs):
+        """请求下载地址，地址失效(403/410)时重新解析后重试一次"""
+        resp = None
+        for _ in range(2):
+            url = link.url
+            resp = self._head(url, **kwargs) if head else self._get(url, stream=True, timeout=None, **kwargs)
+            if resp is not None and resp.status_code in (requests.codes['forbidden'], requests.codes['gone']):
+                resp.close()
+                if link.refresh(url):
+                    continue
+            break
+        return resp
+
+    def _down_segment(self, link, journal, index, writer, file_name, callback=None, resp=None) -> bool:
+        """下载日志中的一个分段，写入到分段对应的偏移处"""
+        start, end, done, _ = journal.segments[index]
+        offset = start + done
+        if resp is None or offset > 0:
+            headers = {**self._headers, 'Range': f'bytes={offset}-{end - 1}'}
+            resp = self._get_link(link, headers=headers)
+        if not resp or (offset > 0 and resp.status_code != requests.codes['partial_content']):
+            logger.error(f"Download segment: request failed {index=}, {offset=}, {end=}")
+            return False
+        sizer = ChunkSizer(end - offset, file_name, down_limiter)  # 根据下载速度调整块大小
+        try:
+            for chunk in sizer.iter_content(resp, end - offset):  # 限制长度，防止服务器返回多余数据
+                writer.write_at(offset, chunk)
+                offset += len(chunk)
+                journal.update(index, chunk)
+                if callback:
+                    callback(file_name, journal.size, journal.done_size)
+                if offset >= end:
+                    break
+        except Cloud189.STREAM_ERRORS as e:  # 已写入的部分记录在日志中，下次从断开处续传
+            logger.error(f"Download segment: interrupted {index=}, {offset=}, {end=}, {e=}")
+            return False
+        finally:
+            resp.close()
+        return offset >= end
+
+    def _down_one_link(self, durl, save_path, callback=None, threads=1, file_info=None, refresh=None) -> int:
+        """下载器
+        :param threads: 分段下载的连接数，大于 1 且服务器支持分段时启用
+        :param file_info: 远端文件信息，用于判断续传的数据是否仍然有效，带有 md5 时校验下载的数据
+        :param refresh: () -> str，下载地址失效时重新获取地址
+        """
         if not os.path.exists(save_path):
             os.makedirs(save_path)
         os.environ['LANG'] = 'enUS.UTF-8'
-        resp = self._get(durl, stream=True, timeout=None)
+        link = DownLink(durl, refresh)
+        resp = None
+        if threads > 1:
+            resp = self._get_link(link, head=True)
+            if not resp or resp.headers.get('accept-ranges', '').lower() != 'bytes':
+                logger.debug("Download link: range not supported, fallback to single connection")
+                resp, threads = None, 1
+        if resp is None:
+            resp = self._get_link(link)
         if not resp:
             logger.error("Download link: network error!")
             return Cloud189.FAILED
 
-        content_d = resp.headers['content-disposition'].encode('latin-1').decode('utf-8')
-        file_name = re.search(r'filename="(.+)"', content_d)
-        file_name = file_name.group(1) if file_name else ''
+        file_name = self._get_down_file_name(resp)
         if not file_name:
             logger.error("Download link: cannot get file name!")
             return Cloud189.FAILED
@@ -875,46 +1384,276 @@ class Cloud189(object):
         else:  # no content length in headers
             total_size = -1
 
-        now_size = 0
-        if os.path.exists(file_path) and total_size != -1:
-            now_size = os.path.getsize(file_path)  # 本地已经下载的文件大小
-            if now_size >= total_size:  # 已经下载完成
-                if callback is not None:
-                    callback(file_name, total_size, now_size, 'exist')
-                logger.debug(f"Download link: the file already exists in the local {file_name=} {durl=}")
-                return Cloud189.SUCCESS
-            else:  # 断点续传
-                headers = {**self._headers, 'Range': 'bytes=%d-' % now_size}
-                resp = self._get(durl, stream=True, headers=headers, timeout=None)
-                if not resp:
-                    return Cloud189.FAILED
+        if total_size == -1:  # 无法续传，直接写入
+            logger.debug(f'Download link: {file_path=}, unknown size')
+            now_size = 0
+            try:
+                with FileWriter(file_path, truncate=True) as writer:
+                    for chunk in ChunkSizer(total_size, file_name, down_limiter).iter_content(resp):
+                        writer.write(chunk)
+                        now_size += len(chunk)
+                        if callback:
+                            callback(file_name, total_size, now_size)
+            except Cloud189.STREAM_ERRORS as e:
+                logger.error(f"Download link: interrupted {file_path=}, {now_size=}, {e=}")
+                return Cloud189.FAILED
+            if callback:
+                callback(file_name, now_size, now_size)
+            logger.debug(f"Download link: finished {now_size=}")
+            return Cloud189.SUCCESS
+
+        if os.path.exists(file_path) and os.path.getsize(file_path) == total_size:  # 已经下载完成
+            if callback is not None:
+                callback(file_name, total_size, total_size, 'exist')
+            logger.debug(f"Download link: the file already exists in the local {file_name=} {durl=}")
+            return Cloud189.SUCCESS
 
-        logger.debug(f'Download link: {file_path=}, {now_size=}, {total_size=}')
-        chunk_size = get_chunk_size(total_size)
-        with open(file_path, "ab") as f:
-            for chunk in resp.iter_content(chunk_size):
-                if chunk:
-                    f.write(chunk)
-                    f.flush()
-                    now_size += len(chunk)
-                    if callback:
-                        callback(file_name, total_size, now_size)
-        if total_size == -1 and callback:
-            callback(file_name, now_size, now_size)
-        logger.debug(f"Download link: finished {total_size=}, {now_size=}")
+        if file_info:
+            journal = DownJournal(file_path, total_size, file_info.id, file_info.optime)
+        else:
+            journal = DownJournal(file_path, total_size, optime=resp.headers.get('last-modified', ''))
+        journal.prepare(threads)
+        allocated = os.path.getsize(journal.part_path) if os.path.exists(journal.part_path) else 0
+        if not has_enough_space(save_path, total_size - allocated):
+            resp.close()
+            return Cloud189.DOWN_SPACE_ERROR
+        pending = journal.pending()
+        link = DownLink(resp.url, refresh)  # 重定向后的下载节点地址，续传、分段请求不必再跳转
+        if threads > 1 or journal.done_size > 0:
+            resp.close()
+            resp = None
+        logger.debug(f'Download link: {file_path=}, {journal.done_size=}, {total_size=}, {len(pending)=}')
+
+        with FileWriter(journal.part_path, total_size) as writer:  # 预分配空间，多个分段按偏移写入
+            with ThreadPoolExecutor(max_workers=max(threads, 1)) as pool:
+                results = list(pool.map(
+                    lambda i: self._down_segment(link, journal, i, writer, file_name, callback, resp), pending))
+        journal.save()
+        if not all(results):
+            logger.error(f"Download link: failed, {journal.done_size=}, {total_size=}")
+            return Cloud189.FAILED
+        if file_info and file_info.md5:
+            md5 = journal.file_md5()
+            if md5 != file_info.md5.upper():
+                logger.error(f"Download link: md5 mismatch {file_path=}, {md5=}, {file_info.md5=}")
+                journal.discard()  # 保留 .part 文件，下次重新下载
+                return Cloud189.DOWN_MD5_ERROR
+            logger.debug(f"Download link: md5 verified {file_path=}, {md5=}")
+        journal.finish()
+        if file_info and file_info.md5:  # 以后上传该文件时不需要重新计算 md5
+            md5_cache.put(file_path, file_info.md5.upper())
+        if callback:
+            callback(file_name, total_size, total_size)
+        logger.debug(f"Download link: finished {total_size=}")
         return Cloud189.SUCCESS
 
-    def down_file_by_id(self, fid, save_path='./Download', callback=None) -> int:
-        """通过 fid 下载单个文件"""
-        code, infos = self.get_file_info_by_id(fid)
+    def prefetch_down_urls(self, fids):
+        """后台批量解析文件下载地址，之后的下载直接使用缓存"""
+        self._resolver.prefetch(list(fids))
+
+    def down_file_by_id(self, fid, save_path='./Download', callback=None, threads=1, md5='') -> int:
+        """通过 fid 下载单个文件
+        :param threads: 分段下载连接数
+        :param md5: 文件 md5(文件列表中获取)，用于校验下载的数据
+        """
+        code, durl, infos = self._resolver.resolve(fid)
         if code != Cloud189.SUCCESS:
             logger.error(f"Down by id: 获取文件{fid=}详情失败！")
             return code
-        durl = 'https:' + infos.durl
-        return self._down_one_link(durl, save_path, callback)
+        if md5:
+            infos = infos._replace(md5=md5)
+        refresh = lambda: self._resolver.resolve(fid, force=True)[1]
+        return self._down_one_link(durl, save_path, callback, threads, infos, refresh)
+
+    def cat_file_by_id(self, fid, out=None, start=0, end=None) -> int:
+        """将文件内容直接写到 out(默认标准输出)，不经过磁盘
+        :param out: 二进制可写对象
+        :param start: 起始字节
+        :param end: 结束字节(包含)，None 表示到文件末尾
+        :return: Cloud189 状态码
+        """
+        code, durl, infos = self._resolver.resolve(fid)
+        if code != Cloud189.SUCCESS:
+            logger.error(f"Cat by id: get file's {fid=} details failed!")
+            return code
+        out = out or sys.stdout.buffer
+        headers = self._headers
+        if start or end is not None:
+            headers = {**self._headers, 'Range': f"bytes={start}-{'' if end is None else end}"}
+        link = DownLink(durl, lambda: self._resolver.resolve(fid, force=True)[1])
+        resp = self._get_link(link, headers=headers)
+        if not resp or (headers is not self._headers and resp.status_code != requests.codes['partial_content']):
+            logger.error(f"Cat by id: request failed {fid=}, {start=}, {end=}")
+            return Cloud189.FAILED
+        total_size = int(resp.headers.get('content-length') or -1)
+        logger.debug(f"Cat by id: {infos.name=}, {start=}, {end=}, {total_size=}")
+        try:
+            for chunk in ChunkSizer(total_size, infos.name, down_limiter).iter_content(resp):
+                out.write(chunk)
+            out.flush()
+        except BrokenPipeError:  # 下游程序提前退出，如 head
+            logger.debug(f"Cat by id: pipe closed by reader {fid=}")
+        finally:
+            resp.close()
+        return Cloud189.SUCCESS
 
-    def down_dirzip_by_id(self, fid, save_path='./Download', callback=None) -> int:
-        """打包下载文件夹"""
+    def _walk_remote_dir(self, fid, rel_path='') -> (int, list, list):
+        """递归遍历网盘文件夹，任何一个文件夹列出失败时停止遍历并返回错误码(不能当作空文件夹)
+        :return: Cloud189 状态码, 文件夹相对路径列表, (文件所在文件夹相对路径, FileInfo) 列表
+        """
+        folders, files = [], []
+        code, file_list = self._list_folder(fid)
+        if code != Cloud189.SUCCESS:
+            logger.error(f"Walk remote dir: list {fid=} {rel_path=} failed, {code=}")
+            return code, folders, files
+        for item in file_list:
+            if item.isFolder:
+                sub_path = rel_path + os.sep + item.name if rel_path else item.name
+                folders.append(sub_path)
+                code, sub_folders, sub_files = self._walk_remote_dir(item.id, sub_path)
+                folders.extend(sub_folders)
+                files.extend(sub_files)
+                if code != Cloud189.SUCCESS:
+                    return code, folders, files
+            else:
+                files.append((rel_path, item))
+        return Cloud189.SUCCESS, folders, files
+
+    def _down_files(self, folders, files, save_path, down_one, callback=None, failed_callback=None,
+                    down_handler=None, workers=3) -> int:
+        """按目录结构并行下载一批文件
+        :param folders: 文件夹相对路径列表
+        :param files: (文件所在文件夹相对路径, FileInfo) 列表
+        :param down_one: (FileInfo, 本地文件夹, 进度回调) -> Cloud189 状态码
+        :return: Cloud189 状态码
+        """
+        for folder in ['', *folders]:  # 包括空文件夹
+            local_dir = save_path + os.sep + folder if folder else save_path
+            if not os.path.exists(local_dir):
+                os.makedirs(local_dir)
+
+        total_files = len(files)
+        total_size = sum(int(item.size or 0) for _, item in files)
+        need_size = 0  # 续传时扣除本地已经完成的文件与 .part 已经分配的空间
+        for rel_path, item in files:
+            size = int(item.size or 0)
+            file_path = (save_path + os.sep + rel_path if rel_path else save_path) + os.sep + item.name
+            if os.path.isfile(file_path) and os.path.getsize(file_path) == size:
+                continue
+            part_path = file_path + DownJournal.PART_SUFFIX
+            need_size += max(size - (os.path.getsize(part_path) if os.path.isfile(part_path) else 0), 0)
+        if not has_enough_space(save_path, need_size):
+            return Cloud189.DOWN_SPACE_ERROR
+        folder_name = get_file_name(save_path)
+        lock = Lock()
+        sizes = {}  # 每个文件已下载的大小
+        counts = {'done': 0, 'failed': 0, 'size': 0}  # size: 所有文件已下载大小之和
+        if down_handler:
+            down_handler(0, total_files)
+        logger.debug(f"Down files: {len(folders)=}, {total_files=}, {total_size=}, {need_size=}")
+
+        def _down_one(rel_path, item):
+            def _call_back(file_name, total, now, msg=''):
+                with lock:
+                    counts['size'] += now - sizes.get(item.id, 0)  # 只累加变化量，不必每次求和
+                    sizes[item.id] = now
+                    if callback and total_size:
+                        callback(folder_name, total_size, counts['size'])
+
+            local_dir = save_path + os.sep + rel_path if rel_path else save_path
+            try:
+                code = down_one(item, local_dir, _call_back)
+            except Exception as e:  # 超时、写文件出错等，单个文件失败不影响其它文件
+                logger.error(f"Down files: {item.name=} an error occurred! {e=}")
+                code = Cloud189.FAILED
+            with lock:
+                counts['done'] += 1
+                if code != Cloud189.SUCCESS:
+                    counts['failed'] += 1
+                if down_handler:
+                    down_handler(counts['done'], total_files)
+            if code != Cloud189.SUCCESS:
+                logger.debug(f"Down files: {item.name=} failed, {code=}")
+                if failed_callback:
+                    failed_callback(code, item)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_down_one, rel_path, item) for rel_path, item in files]
+            for future in futures:
+                future.result()  # _down_one 自己处理异常，这里只是确保不会有错误被忽略
+        if callback and total_size == 0:  # 空文件夹
+            callback(folder_name, 1, 1)
+        logger.debug(f"Down files: finished {total_files=}, failed={counts['failed']}")
+        return Cloud189.SUCCESS if counts['failed'] == 0 else Cloud189.FAILED
+
+    def down_dir_by_id(self, fid, save_path='./Download', callback=None, failed_callback=None,
+                       down_handler=None, workers=3, threads=1) -> int:
+        """递归下载文件夹，保持目录结构，多个文件并行下载
+        :param func callback: 下载进度回调，汇总整个文件夹的进度
+        :param func failed_callback: 单个文件下载失败的回调 (code, FileInfo)
+        :param func down_handler: 已完成文件数回调 (done, total)
+        :param int workers: 同时下载的文件数
+        :param int threads: 单个文件分段下载连接数
+        :return: Cloud189 状态码
+        """
+        logger.debug(f"Down dir: start walking {fid=}")
+        code, folders, files = self._walk_remote_dir(fid)
+        if code != Cloud189.SUCCESS:
+            return code
+        self.prefetch_down_urls(item.id for _, item in files)
+
+        def _down_one(item, local_dir, call_back):
+            return self.down_file_by_id(item.id, local_dir, call_back, threads, item.md5)
+
+        return self._down_files(folders, files, save_path, _down_one, callback, failed_callback,
+                                down_handler, workers)
+
+    def mirror_dir(self, fid, save_path='./Download', delete=False, dry_run=False, callback=None,
+                   failed_callback=None, down_handler=None, workers=3, threads=1) -> (int, MirrorPlan):
+        """增量镜像文件夹，只下载新增或大小、lastOpTime 发生变化的文件
+        :param delete: 删除远端已经不存在的本地文件
+        :param dry_run: 只生成镜像计划，不下载、不删除
+        :return: Cloud189 状态码, MirrorPlan
+        """
+        logger.debug(f"Mirror: start walking {fid=}")
+        code, folders, files = self._walk_remote_dir(fid)
+        if code != Cloud189.SUCCESS:  # 远端列表不完整，不能据此删除本地文件
+            logger.error(f"Mirror: walk {fid=} failed, {code=}, nothing deleted")
+            return code, MirrorPlan()
+        manifest = MirrorManifest(save_path)
+        plan = manifest.plan(files, delete)
+        if dry_run:
+            return Cloud189.SUCCESS, plan
+
+        for key in plan.deleted:
+            manifest.remove_local(key)
+        todo = plan.new + plan.changed
+        self.prefetch_down_urls(item.id for _, item in todo)
+        for rel_path, item in plan.changed:  # 大小可能不变，删除旧文件以免被当作已下载
+            local = os.path.join(save_path, rel_path, item.name)
+            if os.path.isfile(local):
+                os.remove(local)
+
+        rel_paths = {item.id: rel_path for rel_path, item in todo}
+
+        def _down_one(item, local_dir, call_back):
+            code = self.down_file_by_id(item.id, local_dir, call_back, threads, item.md5)
+            if code == Cloud189.SUCCESS:
+                manifest.add(rel_paths[item.id], item)
+            return code
+
+        try:
+            code = self._down_files(folders, todo, save_path, _down_one, callback, failed_callback,
+                                    down_handler, workers)
+        finally:
+            manifest.save()
+        logger.debug(f"Mirror: finished {code=}, {len(todo)=}, {plan.size=}")
+        return code, plan
+
+    def down_dirzip_by_id(self, fid, save_path='./Download', callback=None, extract=False) -> int:
+        """打包下载文件夹
+        :param extract: 边下载边解压到 save_path，不保存压缩包，callback 报告每个文件的解压进度
+        """
         url = self._host_url + '/downloadMultiFiles.action'
         params = {
             'fileIdS': fid,
@@ -928,7 +1667,47 @@ class Cloud189(object):
             logger.debug(f"Down folder failed: {resp.status_code}")
             return Cloud189.FAILED
 
-        return self._down_one_link(durl, save_path, callback)
+        if not extract:
+            return self._down_one_link(durl, save_path, callback)
+        try:
+            resp = self._get(durl, stream=True, timeout=None)  # 服务器边打包边发送，中途可能停顿较长时间
+        except TimeoutError:
+            return Cloud189.NETWORK_ERROR
+        if not resp or resp.status_code != requests.codes['ok']:
+            logger.error(f"Down folder: network error! {durl=}")
+            return Cloud189.FAILED
+        extractor = ZipStreamExtractor(save_path, callback)
+        try:
+            with resp:
+                extractor.extract(ChunkSizer(-1, 'zip', down_limiter).iter_content(resp))
+        except (ValueError, EOFError, zlib.error, *Cloud189.STREAM_ERRORS) as e:
+            logger.error(f"Down folder: extract failed {fid=}, {e=}")
+            return Cloud189.FAILED
+        logger.debug(f"Down folder: extracted {extractor.files=}, {extractor.size=}")
+        return Cloud189.SUCCESS
+
+    def down_pack_by_id(self, fid, save_path='./Download', callback=None) -> int:
+        """下载 upload_pack 上传的 tar 文件，边下载边解包到 save_path，不保存 tar 文件
+        :param callback: 每个文件的解包进度
+        """
+        code, durl, infos = self._resolver.resolve(fid)
+        if code != Cloud189.SUCCESS:
+            logger.error(f"Down pack: get file's {fid=} details failed!")
+            return code
+        link = DownLink(durl, lambda: self._resolver.resolve(fid, force=True)[1])
+        resp = self._get_link(link)
+        if not resp or resp.status_code != requests.codes['ok']:
+            logger.error(f"Down pack: network error! {fid=}")
+            return Cloud189.FAILED
+        unpacker = TarUnpacker(save_path, callback)
+        try:
+            with resp:
+                unpacker.extract(ChunkSizer(int(infos.size or -1), infos.name, down_limiter).iter_content(resp))
+        except (ValueError, EOFError, tarfile.TarError, *Cloud189.STREAM_ERRORS) as e:
+            logger.error(f"Down pack: unpack failed {fid=}, {e=}")
+            return Cloud189.FAILED
+        logger.debug(f"Down pack: unpacked {unpacker.files=}, {unpacker.size=}")
+        return Cloud189.SUCCESS
 
     def delete_by_id(self, fid):
         '''删除文件(夹)'''
@@ -1062,9 +1841,12 @@ class Cloud189(object):
 
         return results
 
-    def get_share_folder_info(self, share_id, verify_code, pwd='undefined'):
-        """获取分享的文件夹信息"""
-        result = []
+    def get_share_folder_info(self, share_id, verify_code, pwd='', fid='') -> (int, FileList):
+        """获取分享的文件夹中一层的文件信息
+        :param fid: 子文件夹 id，为空时获取分享的根目录
+        :return: Cloud189 状态码, FileList
+        """
+        result = FileList()
         page = 1
         info_url = self._host_url + '/v2/listShareDir.action'
         while True:
@@ -1077,76 +1859,181 @@ class Cloud189(object):
                 'pageNum': page,
                 'pageSize': 60
             }
-            resp = requests.get(info_url, params=params, headers=self._headers, verify=False)
+            if fid:
+                params['fileId'] = fid
+            try:
+                resp = self._get(info_url, params=params)
+            except TimeoutError:
+                resp = None
             if not resp:
-                return None
-            resp = resp.json()
+                logger.error(f"Share folder info: network error! {share_id=}, {fid=}")
+                return Cloud189.NETWORK_ERROR, result
+            try:
+                resp = resp.json()
+            except (json.JSONDecodeError, simplejson.errors.JSONDecodeError):
+                logger.error(f"Share folder info: bad response {share_id=}, {fid=}")
+                return Cloud189.FAILED, result
             if 'errorVO' in resp:
-                print("是文件夹，并且需要密码或者密码错误！")
-                logger.debug("Access password is required!")
-                return None
+                logger.debug(f"Share folder info: access password is required! {share_id=}, {resp['errorVO']=}")
+                return Cloud189.PASSWORD_ERROR if pwd else Cloud189.LACK_PASSWORD, result
             for item in resp['data']:
-                durl = 'https:' + item['downloadUrl'] if 'downloadUrl' in item else ''
-                print('#', item['fileId'], '文件名', item['fileName'], item['fileSize'], durl)
+                durl = item['downloadUrl'] if 'downloadUrl' in item else ''
+                result.append(FileInfo(name=item['fileName'], id=item['fileId'], pid=fid or share_id,
+                                       size=item['fileSize'] if 'fileSize' in item else 0,
+                                       optime=item['lastOpTime'] if 'lastOpTime' in item else '',
+                                       isFolder=item['isFolder'] if 'isFolder' in item else False,
+                                       durl=durl, md5=item['md5'] if 'md5' in item else ''))
             if resp['recordCount'] <= resp['pageSize'] * resp['pageNum']:
                 break
-
             page += 1
-        print(f"共 {resp['recordCount']} 条记录")
-        return result
+        logger.debug(f"Share folder info: {share_id=}, {fid=}, {len(result)=}")
+        return Cloud189.SUCCESS, result
 
-    def get_share_file_info(self, share_id, pwd=''):
-        """获取分享的文件信息"""
+    def get_share_file_info(self, share_id, pwd='') -> (int, FileInfo):
+        """获取分享的文件信息，FileInfo.durl 为下载地址"""
         verify_url = self._host_url + "/shareFileVerifyPass.action"
         params = {
             'fileVO.id': share_id,
             'accessCode': pwd
         }
-        resp = requests.get(verify_url, params=params, verify=False)
-        if not resp:
-            return None
-        resp = resp.json()
+        resp = self._get(verify_url, params=params)
         if not resp:
-            print("是文件，并且需要密码或者密码错误！")
-            return None
-        f_id = resp['fileId']
-        f_name = resp['fileName']
-        f_size = resp['fileSize']
-        f_type = resp['fileType']
-        durl = resp['longDownloadUrl']
-
-        print(f_id, f_name, f_size, f_type, durl)
-
-    def get_file_info_by_url(self, share_url, pwd=''):
-        """通过分享链接获取信息"""
-
-        first_page = requests.get(share_url, headers=self._headers, verify=False)
+            logger.error(f"Share file info: network error! {share_id=}")
+            return Cloud189.NETWORK_ERROR, FileInfo()
+        try:
+            resp = resp.json()
+        except ValueError:
+            resp = None
+        if not resp or 'longDownloadUrl' not in resp:
+            logger.debug(f"Share file info: access password is required! {share_id=}")
+            return Cloud189.PASSWORD_ERROR if pwd else Cloud189.LACK_PASSWORD, FileInfo()
+        return Cloud189.SUCCESS, FileInfo(name=resp['fileName'], id=resp['fileId'], size=resp['fileSize'],
+                                          ftype=resp['fileType'] if 'fileType' in resp else '',
+                                          durl=resp['longDownloadUrl'], md5=resp['md5'] if 'md5' in resp else '')
+
+    def get_file_info_by_url(self, share_url) -> (int, ShareInfo):
+        """解析分享链接页面
+        :return: Cloud189 状态码, ShareInfo(name, id=shareId, isFolder, durl, verify=verifyCode)
+        """
+        first_page = self._get(share_url)
         if not first_page:
             logger.error("File info: network error!")
-            return None
+            return Cloud189.NETWORK_ERROR, ShareInfo()
         first_page = first_page.text
         # 抱歉，您访问的页面地址有误，或者该页面不存在
         if '您访问的页面地址有误' in first_page:
             logger.debug(f"The sharing link has been cancelled {share_url}")
-            return None
+            return Cloud189.FILE_CANCELLED, ShareInfo()
+        name = re.search(r"""(?:window\.fileName|_fileName)\s*=\s*['"](.+?)['"]""", first_page)
+        name = name.group(1) if name else ''
         if 'window.fileName' in first_page:  # 文件
-            share_id = re.search(r'class="shareId" value="(\w+?)"', first_page).group(1)
+            share_id = re.search(r'class="shareId" value="(\w+?)"', first_page)
             # 没有密码，则直接暴露 durl
-            durl = re.search(r'class="downloadUrl" value="(\w+?)"', first_page)
-            if durl:
-                durl = durl.group(1)
-                print('直链：', durl)
-                return None
-            is_file = True
+            durl = re.search(r'class="downloadUrl" value="(.+?)"', first_page)
+            durl = durl.group(1).replace('&amp;', '&') if durl else ''
+            verify_code = ''
+            is_folder = False
         else:  # 文件夹
-            share_id = re.search(r"_shareId = '(\w+?)';", first_page).group(1)
-            verify_code = re.search(r"_verifyCode = '(\w+?)';", first_page).group(1)
-            is_file = False
+            share_id = re.search(r"_shareId = '(\w+?)';", first_page)
+            verify_code = re.search(r"_verifyCode = '(\w+?)';", first_page)
+            verify_code = verify_code.group(1) if verify_code else ''
+            durl = ''
+            is_folder = True
+        if not share_id:
+            logger.error(f"File info: cannot parse share page {share_url=}")
+            return Cloud189.URL_INVALID, ShareInfo()
+        share_id = share_id.group(1)
+        logger.debug(f"File info: {share_url=}, {share_id=}, {is_folder=}, {name=}")
+        return Cloud189.SUCCESS, ShareInfo(name=name or share_id, id=share_id, url=share_url, durl=durl,
+                                           isFolder=is_folder, verify=verify_code)
+
+    def _walk_share_dir(self, share, pwd='', workers=8) -> (int, list, list):
+        """并发遍历分享的文件夹，每次并发获取同一层的所有文件夹
+        :return: Cloud189 状态码, [文件夹相对路径], [(文件所在文件夹相对路径, FileInfo)]
+        """
+        folders, files = [], []
+        level = [('', '')]  # (相对路径, 文件夹 id)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while level:
+                results = pool.map(lambda x: self.get_share_folder_info(share.id, share.verify, pwd, x[1]), level)
+                next_level = []
+                for (rel_path, _), (code, items) in zip(level, results):
+                    if code != Cloud189.SUCCESS:
+                        return code, folders, files
+                    for item in items:
+                        if item.isFolder:
+                            sub_path = rel_path + os.sep + item.name if rel_path else item.name
+                            folders.append(sub_path)
+                            next_level.append((sub_path, item.id))
+                        else:
+                            files.append((rel_path, item))
+                logger.debug(f"Walk share dir: {len(level)=} folders, {len(files)=}")
+                level = next_level
+        return Cloud189.SUCCESS, folders, files
+
+    @staticmethod
+    def _full_url(durl) -> str:
+        return 'https:' + durl if durl.startswith('//') else durl
+
+    def down_file_by_url(self, share_url, pwd='', save_path='./Download', callback=None, threads=1,
+                         share=None) -> int:
+        """通过分享链接下载文件
+        :param share: get_file_info_by_url 的结果，为 None 时重新解析分享页面
+        :return: Cloud189 状态码
+        """
+        if share is None:
+            code, share = self.get_file_info_by_url(share_url)
+            if code != Cloud189.SUCCESS:
+                return code
+        if share.isFolder:
+            return self.down_dir_by_url(share_url, pwd, save_path, callback, threads=threads, share=share)
+
+        def refresh():
+            return self._full_url(self.get_share_file_info(share.id, pwd)[1].durl)
 
-        if is_file:
-            return self.get_share_file_info(share_id, pwd)
+        if share.durl:  # 没有密码的分享直接给出了地址
+            file_info = FileInfo(name=share.name, id=share.id)
+            durl = self._full_url(share.durl)
         else:
-            return self.get_share_folder_info(share_id, verify_code, pwd)
+            code, file_info = self.get_share_file_info(share.id, pwd)
+            if code != Cloud189.SUCCESS:
+                return code
+            durl = self._full_url(file_info.durl)
+        return self._down_one_link(durl, save_path, callback, threads, file_info, refresh)
+
+    def down_dir_by_url(self, share_url, pwd='', save_path='./Download', callback=None, mkdir=True,
+                        failed_callback=None, down_handler=None, workers=3, threads=1, share=None) -> int:
+        """通过分享链接下载文件夹，保持目录结构，多个文件并行下载
+        :param mkdir: 在 save_path 下新建以分享名称命名的文件夹
+        :param share: get_file_info_by_url 的结果，为 None 时重新解析分享页面
+        :return: Cloud189 状态码
+        """
+        if share is None:
+            code, share = self.get_file_info_by_url(share_url)
+            if code != Cloud189.SUCCESS:
+                return code
+        if not share.isFolder:
+            return self.down_file_by_url(share_url, pwd, save_path, callback, threads, share)
+        logger.debug(f"Down share dir: start walking {share.id=}")
+        code, folders, files = self._walk_share_dir(share, pwd)
+        if code != Cloud189.SUCCESS:
+            return code
+        if mkdir:
+            save_path = save_path + os.sep + share.name
+
+        def _down_one(item, local_dir, call_back):
+            def refresh():  # 重新获取该层文件夹的列表以得到新的下载地址
+                _, items = self.get_share_folder_info(share.id, share.verify, pwd,
+                                                      '' if item.pid == share.id else item.pid)
+                return next((self._full_url(i.durl) for i in items if i.id == item.id and i.durl), '')
+
+            if not item.durl:
+                logger.debug(f"Down share dir: no download url {item.name=}")
+                return Cloud189.FAILED
+            return self._down_one_link(self._full_url(item.durl), local_dir, call_back, threads, item, refresh)
+
+        return self._down_files(folders, files, save_path, _down_one, callback, failed_callback,
+                                down_handler, workers)
 
     def user_sign(self):
         """签到 + 抽奖"""
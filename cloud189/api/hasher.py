@@ -0,0 +1,69 @@
+"""
+上传前的并行 md5 计算：按上传顺序提前计算后面若干个文件的 md5，上传时直接使用结果
+hashlib 计算时会释放 GIL，使用线程即可利用多个核心
+"""
+
+import os
+from collections import deque
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+from cloud189.api.utils import logger, get_file_md5
+
+__all__ = ['HashPipeline']
+
+
+class HashPipeline:
+    """md5 预计算流水线，最多领先上传 window 个文件"""
+
+    def __init__(self, paths, window=8, workers=0):
+        """
+        :param paths: 按上传顺序排列的文件路径，之后发现的文件使用 add 加入
+        :param window: 已提交计算但还没有被取走的最大文件数
+        :param workers: 计算线程数，0 表示使用 cpu 核心数
+        """
+        self._paths = deque(paths)  # 等待提交计算的文件
+        self._window = max(window, 1)
+        self._pool = ThreadPoolExecutor(max_workers=workers or min(os.cpu_count() or 1, self._window))
+        self._futures = {}  # 文件路径 -> Future
+        self._lock = Lock()
+        with self._lock:
+            self._fill()
+
+    def _fill(self):
+        while self._paths and len(self._futures) < self._window:
+            path = self._paths.popleft()
+            self._futures[path] = self._pool.submit(get_file_md5, path)
+
+    def add(self, path):
+        """加入新发现的文件"""
+        with self._lock:
+            self._paths.append(path)
+            self._fill()
+
+    def get(self, path) -> str:
+        """获取文件 md5，还没有算完时等待，不在队列中时直接计算"""
+        with self._lock:
+            future = self._futures.pop(path, None)
+            if future is None and path in self._paths:  # 还没有轮到计算
+                self._paths.remove(path)
+            self._fill()
+        try:
+            if future is None:
+                logger.debug(f"Hash pipeline: {path=} not queued, hash it now")
+                return get_file_md5(path)
+            if not future.done():
+                logger.debug(f"Hash pipeline: waiting for {path=}")
+            return future.result()
+        except OSError as e:
+            logger.error(f"Hash pipeline: hash {path=} failed, {e=}")
+            return ''
+
+    def close(self):
+        """取消还没有开始的计算"""
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+            self._paths.clear()
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,153 @@
+"""
+下载断点续传日志
+
+数据先写入 name.part，日志保存在 name.part.json，下载完成后原子重命名为 name
+日志记录远端文件 id、大小、lastOpTime 与每个分段已完成的字节数、分段 md5，
+续传时校验已下载的数据，只重新下载缺失或损坏的部分
+"""
+
+import os
+import json
+import hashlib
+from time import monotonic
+from threading import Lock
+
+from cloud189.api.utils import logger, BufferReader
+
+__all__ = ['DownJournal']
+
+
+class DownJournal:
+    """下载日志，一个分段为 [start, end, done, md5]"""
+
+    PART_SUFFIX = '.part'
+    JOURNAL_SUFFIX = '.part.json'
+    MIN_SEGMENT = 1 << 20  # 分段最小 1MB
+    SAVE_INTERVAL = 1  # 日志保存的最小间隔(秒)
+
+    def __init__(self, file_path, size, fid='', optime=''):
+        self.file_path = file_path
+        self.part_path = file_path + self.PART_SUFFIX
+        self.journal_path = file_path + self.JOURNAL_SUFFIX
+        self.size = size
+        self._remote = {'id': str(fid), 'size': size, 'optime': str(optime)}
+        self._segments = []
+        self._hashes = []  # 每个分段已完成部分的 md5 对象
+        self._lock = Lock()
+        self._last_save = 0
+
+    @property
+    def segments(self) -> list:
+        return self._segments
+
+    @property
+    def done_size(self) -> int:
+        """已完成的字节数"""
+        return sum(seg[2] for seg in self._segments)
+
+    def _load(self) -> bool:
+        """读取日志，远端文件发生变化或日志损坏时返回 False"""
+        if not os.path.exists(self.journal_path) or not os.path.exists(self.part_path):
+            return False
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            segments = [list(seg) for seg in data['segments']]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.debug(f"Journal: broken journal {self.journal_path=}, {e=}")
+            return False
+        if data.get('remote') != self._remote:
+            logger.debug(f"Journal: remote file changed {data.get('remote')=}, {self._remote=}")
+            return False
+        self._segments = segments
+        return True
+
+    def _verify(self):
+        """重新计算分段已完成部分的 md5，不一致的分段从头下载"""
+        self._hashes = []
+        with open(self.part_path, 'rb') as f:
+            for seg in self._segments:
+                start, _, done, digest = seg
+                _md5 = hashlib.md5()
+                f.seek(start)
+                left = done
+                reader = BufferReader(f)
+                while left > 0:
+                    data = reader.read(min(left, 1 << 20))
+                    if not data:
+                        break
+                    _md5.update(data)
+                    left -= len(data)
+                if left > 0 or _md5.hexdigest() != digest:
+                    logger.debug(f"Journal: segment {start=} {done=} corrupted, restart it")
+                    seg[2] = 0
+                    _md5 = hashlib.md5()
+                    seg[3] = _md5.hexdigest()
+                self._hashes.append(_md5)
+
+    def _plan(self, threads):
+        """新建下载，切分分段"""
+        seg_size = max((self.size + threads - 1) // threads, self.MIN_SEGMENT)
+        self._segments = [[start, min(start + seg_size, self.size), 0, hashlib.md5().hexdigest()]
+                          for start in range(0, self.size, seg_size)] or [[0, 0, 0, hashlib.md5().hexdigest()]]
+        self._hashes = [hashlib.md5() for _ in self._segments]
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+    def prepare(self, threads=1):
+        """读取、校验已有日志，没有则按连接数切分分段"""
+        if self._load():
+            self._verify()
+            logger.debug(f"Journal: resume {self.part_path=}, {self.done_size=}, {self.size=}")
+        else:
+            self._plan(threads)
+        self.save()
+
+    def pending(self) -> list:
+        """未完成的分段序号"""
+        return [i for i, seg in enumerate(self._segments) if seg[0] + seg[2] < seg[1]]
+
+    def update(self, index, data):
+        """分段 index 写入了 data"""
+        with self._lock:
+            seg = self._segments[index]
+            self._hashes[index].update(data)
+            seg[2] += len(data)
+            seg[3] = self._hashes[index].hexdigest()
+            if monotonic() - self._last_save >= self.SAVE_INTERVAL:
+                self._save()
+
+    def _save(self):
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'remote': self._remote, 'segments': self._segments}, f)
+        os.replace(tmp_path, self.journal_path)
+        self._last_save = monotonic()
+
+    def save(self):
+        """保存日志(原子替换)"""
+        with self._lock:
+            self._save()
+
+    def file_md5(self) -> str:
+        """整个文件的 md5(下载完成后调用)
+        md5 无法由分段结果合并，第一个分段使用下载时计算的结果，其余分段顺序读取一次
+        """
+        _md5 = self._hashes[0].copy()
+        if len(self._segments) > 1:
+            with open(self.part_path, 'rb') as f:
+                f.seek(self._segments[1][0])
+                for data in BufferReader(f):
+                    _md5.update(data)
+        return _md5.hexdigest().upper()
+
+    def discard(self):
+        """删除日志，下次从头下载"""
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def finish(self):
+        """下载完成，重命名为正式文件并删除日志"""
+        os.replace(self.part_path, self.file_path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
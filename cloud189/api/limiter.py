@@ -0,0 +1,57 @@
+"""
+全局带宽限制，所有上传、下载线程共享同一个额度
+"""
+
+from time import sleep, monotonic
+from threading import Lock
+
+__all__ = ['RateLimiter', 'up_limiter', 'down_limiter']
+
+
+class RateLimiter:
+    """令牌桶限速器
+    大块数据拆分成小片依次预约发送时间，多个线程的小片交错排队，公平分享带宽
+    """
+
+    BURST = 0.5  # 允许积攒的空闲额度(秒)
+    MIN_SLICE = 16 << 10  # 16 KB
+
+    def __init__(self, rate=0):
+        """:param rate: bytes/s，0 表示不限速"""
+        self._rate = rate
+        self._next = monotonic()  # 下一片数据可以发送的时间
+        self._lock = Lock()
+
+    @property
+    def rate(self) -> int:
+        return self._rate
+
+    def set_rate(self, rate):
+        """运行时修改限速，0 表示不限速"""
+        with self._lock:
+            self._rate = max(int(rate), 0)
+            self._next = monotonic()
+
+    def consume(self, nbytes) -> float:
+        """申请发送(接收) nbytes 字节的额度，返回等待的时间"""
+        waited = 0.0
+        while nbytes > 0:
+            rate = self._rate
+            if rate <= 0:
+                break
+            size = min(nbytes, max(rate // 100, self.MIN_SLICE))  # 每片约 10ms 的额度
+            with self._lock:
+                now = monotonic()
+                self._next = max(self._next, now - self.BURST)
+                wait = self._next - now
+                self._next += size / rate
+            if wait > 0:
+                sleep(wait)
+                waited += wait
+            nbytes -= size
+        return waited
+
+
+# 全局限速器
+up_limiter = RateLimiter()
+down_limiter = RateLimiter()
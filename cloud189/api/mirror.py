@@ -0,0 +1,110 @@
+"""
+增量镜像：本地清单记录每个已镜像文件的远端 id、大小与 lastOpTime，
+再次镜像时只下载新增或发生变化的文件，可选删除远端已经不存在的本地文件
+"""
+
+import os
+import json
+from threading import Lock
+
+from cloud189.api.utils import logger
+from cloud189.api.types import MirrorPlan
+
+__all__ = ['MirrorManifest']
+
+
+class MirrorManifest:
+    """镜像清单 {相对路径: {'id', 'size', 'optime'}}，保存在镜像文件夹中"""
+
+    FILE_NAME = '.cloud189-mirror.json'
+
+    def __init__(self, save_path):
+        self._save_path = save_path
+        self._path = save_path + os.sep + self.FILE_NAME
+        self._files = {}
+        self._lock = Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self._path):
+            return None
+        try:
+            with open(self._path, 'r', encoding='utf-8') as f:
+                self._files = json.load(f)['files']
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.debug(f"Mirror manifest: broken manifest {self._path=}, {e=}")
+            self._files = {}
+
+    @staticmethod
+    def _key(rel_path, name) -> str:
+        """清单中统一使用 / 分隔路径"""
+        return '/'.join([*rel_path.split(os.sep), name]) if rel_path else name
+
+    def _local_path(self, key) -> str:
+        return os.path.join(self._save_path, *key.split('/'))
+
+    def _local_files(self) -> list:
+        """本地已有的文件(不包括清单与未完成的下载)"""
+        result = []
+        for root, _, names in os.walk(self._save_path):
+            rel_root = os.path.relpath(root, self._save_path)
+            for name in names:
+                if name.startswith(self.FILE_NAME) or name.endswith(('.part', '.part.json', '.part.json.tmp')):
+                    continue
+                result.append(self._key('' if rel_root == '.' else rel_root, name))
+        return result
+
+    def plan(self, files, delete=False) -> MirrorPlan:
+        """对比远端文件与清单
+        :param files: (文件所在文件夹相对路径, FileInfo) 列表
+        :param delete: 是否列出需要删除的本地文件
+        本地文件大小一致但不在清单中时(首次镜像已有的文件)直接加入清单，不重新下载
+        """
+        new, changed, unchanged = [], [], 0
+        size = 0
+        remote = set()
+        for rel_path, item in files:
+            key = self._key(rel_path, item.name)
+            remote.add(key)
+            record = self._files.get(key)
+            local = self._local_path(key)
+            local_size = os.path.getsize(local) if os.path.isfile(local) else -1
+            if record is None:
+                if local_size == int(item.size or 0):
+                    self.add(rel_path, item)
+                    unchanged += 1
+                else:
+                    new.append((rel_path, item))
+                    size += int(item.size or 0)
+            elif (record['size'] != int(item.size or 0) or record['optime'] != str(item.optime)
+                  or local_size != record['size']):
+                changed.append((rel_path, item))
+                size += int(item.size or 0)
+            else:
+                unchanged += 1
+        deleted = [key for key in self._local_files() if key not in remote] if delete else []
+        logger.debug(f"Mirror plan: {len(new)=}, {len(changed)=}, {len(deleted)=}, {unchanged=}, {size=}")
+        return MirrorPlan(new=new, changed=changed, deleted=deleted, unchanged=unchanged, size=size)
+
+    def add(self, rel_path, item):
+        """记录已镜像的文件"""
+        with self._lock:
+            self._files[self._key(rel_path, item.name)] = {'id': str(item.id), 'size': int(item.size or 0),
+                                                           'optime': str(item.optime)}
+
+    def remove_local(self, key):
+        """删除本地文件与清单记录"""
+        local = self._local_path(key)
+        if os.path.isfile(local):
+            os.remove(local)
+        with self._lock:
+            self._files.pop(key, None)
+        logger.debug(f"Mirror: removed local orphan {key=}")
+
+    def save(self):
+        """保存清单(原子替换)"""
+        with self._lock:
+            tmp_path = self._path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'files': self._files}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path)
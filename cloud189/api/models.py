@@ -3,7 +3,9 @@
 元素类型为 namedtuple，至少拥有 name id 两个属性才能放入容器
 """
 
-__all__ = ['FileList', 'PathList', 'TreeList']
+from threading import Lock
+
+__all__ = ['FileList', 'PathList', 'TreeList', 'FolderIndex']
 
 
 class ItemList:
@@ -125,3 +127,56 @@ class PathList(ItemList):
 class TreeList(ItemList):
     """文件夹结构类"""
     pass
+
+
+class FolderIndex:
+    """网盘文件夹索引，每个文件夹只列出一次，{文件夹 id: {(文件名, 大小): 文件 id}}
+    用于批量上传时判断文件、子文件夹是否已经存在，不需要每个文件都请求一次文件列表
+    """
+
+    def __init__(self, lister):
+        """:param lister: (文件夹 id) -> FileList"""
+        self._lister = lister
+        self._folders = {}
+        self._subfolders = {}  # 文件夹 id -> {子文件夹名: 子文件夹 id}
+        self._lock = Lock()
+        self._loading = {}  # 文件夹 id -> Lock，多个线程同时查询同一个文件夹时只列出一次
+
+    def _load(self, fid) -> dict:
+        with self._lock:
+            if fid in self._folders:
+                return self._folders[fid]
+            lock = self._loading.setdefault(fid, Lock())
+        with lock:
+            with self._lock:
+                if fid in self._folders:
+                    return self._folders[fid]
+            items = self._lister(fid)
+            self.seed(fid, items)
+            with self._lock:
+                self._loading.pop(fid, None)
+                return self._folders[fid]
+
+    def seed(self, fid, items):
+        """使用已经获取的文件列表建立索引(新建的文件夹为空列表)，不再请求网络"""
+        files = {(item.name, int(item.size or 0)): item.id for item in items if not item.isFolder}
+        folders = {item.name: str(item.id) for item in items if item.isFolder}
+        with self._lock:
+            self._folders[fid] = files
+            self._subfolders[fid] = folders
+
+    def find(self, fid, name, size):
+        """查找文件，不存在返回 None"""
+        return self._load(fid).get((name, int(size)))
+
+    def folders(self, fid) -> dict:
+        """子文件夹 {文件夹名: 文件夹 id}"""
+        self._load(fid)
+        with self._lock:
+            return dict(self._subfolders[fid])
+
+    def add(self, fid, name, size, file_id):
+        """上传完成后更新索引"""
+        items = self._load(fid)
+        with self._lock:
+            items[(name, int(size))] = file_id
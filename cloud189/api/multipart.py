@@ -0,0 +1,119 @@
+"""
+分片并行上传：大文件切分为多个分片，多个连接同时上传，每个分片带有 md5，失败时只重传该分片
+"""
+
+import hashlib
+from base64 import b64encode
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from cloud189.api.utils import logger
+from cloud189.api.limiter import up_limiter
+
+__all__ = ['MultipartUpload']
+
+
+class _PartBody:
+    """分片请求体，带有长度(不使用 chunked 编码)，迭代时按块发送"""
+
+    def __init__(self, size, chunks):
+        self._size = size
+        self._chunks = chunks
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+
+class MultipartUpload:
+    """分片上传任务，所有分片上传成功后由调用者 commit"""
+
+    PART_SIZE = 16 << 20  # 分片最小 16MB
+    MAX_PARTS = 10000
+    SEND_SIZE = 256 << 10  # 发送时每次交给 requests 的大小，用于限速与进度
+    RETRIES = 3  # 每个分片的重试次数
+
+    def __init__(self, disk, file_upload_url, upload_file_id, up_info, workers=4, offset=0):
+        """
+        :param disk: Cloud189 实例，负责签名与解析响应
+        :param up_info: UpInfo
+        :param workers: 同时上传的分片数
+        :param offset: 服务器已经接收的字节数，只上传之后的数据
+        """
+        self._disk = disk
+        self._url = file_upload_url
+        self._upload_file_id = upload_file_id
+        self._up_info = up_info
+        self._workers = workers
+        self._offset = offset
+        self._session = requests.Session()  # 分片共用连接池
+        self._lock = Lock()
+        self._sent = {}  # 分片起始位置 -> 已发送字节数
+
+    @classmethod
+    def part_size(cls, size) -> int:
+        """分片大小，分片数不超过 MAX_PARTS"""
+        return max(cls.PART_SIZE, -(-size // cls.MAX_PARTS))
+
+    def parts(self) -> list:
+        """切分分片 [(start, end)]"""
+        size = self._up_info.size
+        step = self.part_size(size - self._offset)
+        return [(start, min(start + step, size)) for start in range(self._offset, size, step)]
+
+    def _progress(self, start, sent):
+        with self._lock:
+            self._sent[start] = sent
+            now = self._offset + sum(self._sent.values())
+        if self._up_info.callback and now < self._up_info.size:
+            self._up_info.callback(self._up_info.path, self._up_info.size, now)
+
+    def _iter_part(self, start, data):
+        """按块发送分片数据，更新进度、限速"""
+        view = memoryview(data)
+        sent = 0
+        while sent < len(view):
+            block = view[sent:sent + self.SEND_SIZE]
+            up_limiter.consume(len(block))
+            yield block.tobytes()
+            sent += len(block)
+            self._progress(start, sent)
+
+    def _read_part(self, start, end) -> bytes:
+        with open(self._up_info.path, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def _upload_part(self, start, end) -> bool:
+        data = self._read_part(start, end)
+        if len(data) != end - start:
+            logger.error(f"Multipart upload: file changed while uploading {self._up_info.path=}")
+            return False
+        md5 = b64encode(hashlib.md5(data).digest()).decode()
+        for retry in range(self.RETRIES):
+            self._progress(start, 0)
+            body = _PartBody(len(data), self._iter_part(start, data))
+            ok = self._disk._upload_part_data(self._session, self._url, self._upload_file_id, start, end,
+                                              md5, body)
+            if ok:
+                return True
+            logger.debug(f"Multipart upload: part {start=} {end=} failed, {retry=}")
+        return False
+
+    def upload(self) -> bool:
+        """并行上传所有分片"""
+        parts = self.parts()
+        logger.debug(f"Multipart upload: {self._up_info.path=}, {len(parts)=}, workers={self._workers}")
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            results = list(pool.map(lambda part: self._upload_part(*part), parts))
+        self._session.close()
+        if not all(results):
+            logger.error(f"Multipart upload: {results.count(False)} parts failed {self._up_info.path=}")
+            return False
+        if self._up_info.callback:  # 保证上传完后，两者大小一样
+            self._up_info.callback(self._up_info.path, self._up_info.size, self._up_info.size)
+        return True
@@ -0,0 +1,131 @@
+"""
+下载直链解析与缓存：批量并发解析文件的下载节点地址，过期后重新解析
+"""
+
+from time import time
+from threading import Lock
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from cloud189.api.utils import logger
+
+__all__ = ['UrlResolver', 'DownLink']
+
+
+class UrlResolver:
+    """下载直链解析器，缓存 fid -> (下载节点地址, 过期时间, FileInfo)"""
+
+    TTL = 600  # 链接没有携带过期时间时的缓存时间(秒)
+    MARGIN = 30  # 提前过期，避免下载刚开始链接就失效
+
+    def __init__(self, disk, workers=8, ttl=TTL):
+        """
+        :param disk: Cloud189 实例
+        :param workers: 并发解析数
+        :param ttl: 缓存时间(秒)
+        """
+        self._disk = disk
+        self._ttl = ttl
+        self._cache = {}  # fid -> (url, expires, FileInfo)
+        self._pending = {}  # fid -> Future
+        self._lock = Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def _expires(self, url) -> float:
+        """从签名链接中获取过期时间"""
+        query = {k.lower(): v for k, v in parse_qs(urlparse(url).query).items()}
+        for key in ('expires', 'expire', 'e'):
+            if key in query and query[key][0].isnumeric():
+                stamp = int(query[key][0])
+                stamp = stamp / 1000 if stamp > 1e11 else stamp  # 毫秒
+                return min(stamp, time() + self._ttl) - self.MARGIN
+        return time() + self._ttl - self.MARGIN
+
+    def _resolve(self, fid) -> (int, str, object):
+        """获取文件信息，并跟随一次 302 得到下载节点地址"""
+        code, infos = self._disk.get_file_info_by_id(fid)
+        if code != self._disk.SUCCESS or not infos.durl:
+            logger.error(f"Url resolver: get file's {fid=} details failed!")
+            return code if code != self._disk.SUCCESS else self._disk.FAILED, '', infos
+        durl = 'https:' + infos.durl
+        resp = self._disk._get(durl, allow_redirects=False, stream=True)  # 只需要响应头，不读取响应体
+        if resp is not None and resp.status_code in (requests.codes['found'], requests.codes['moved'],
+                                                     requests.codes['temporary_redirect']):
+            durl = resp.headers.get('Location') or durl
+        if resp is not None:
+            resp.close()
+        with self._lock:
+            self._cache[fid] = (durl, self._expires(durl), infos)
+        logger.debug(f"Url resolver: {fid=} resolved, node={urlparse(durl).netloc}")
+        return self._disk.SUCCESS, durl, infos
+
+    def _task(self, fid):
+        try:
+            return self._resolve(fid)
+        finally:
+            with self._lock:
+                self._pending.pop(fid, None)
+
+    def prefetch(self, fids):
+        """后台并发解析一批文件的下载地址，不阻塞"""
+        with self._lock:
+            for fid in fids:
+                if fid in self._pending:
+                    continue
+                if fid in self._cache and self._cache[fid][1] > time():
+                    continue
+                self._pending[fid] = self._pool.submit(self._task, fid)
+        logger.debug(f"Url resolver: prefetch {len(fids)} files, pending={len(self._pending)}")
+
+    def resolve(self, fid, force=False) -> (int, str, object):
+        """获取下载地址，优先使用缓存
+        :param force: 忽略缓存重新解析(链接失效时)
+        :return: Cloud189 状态码, 下载地址, FileInfo
+        """
+        with self._lock:
+            future = self._pending.get(fid)
+            cached = self._cache.get(fid)
+            if force:
+                self._cache.pop(fid, None)
+        if future is not None and not force:
+            return future.result()
+        if cached and not force and cached[1] > time():
+            return self._disk.SUCCESS, cached[0], cached[2]
+        return self._resolve(fid)
+
+    def invalidate(self, fid):
+        """删除缓存"""
+        with self._lock:
+            self._cache.pop(fid, None)
+
+
+class DownLink:
+    """多个分段共享的下载地址，失效时只重新解析一次"""
+
+    def __init__(self, url, refresh=None):
+        """
+        :param url: 下载地址
+        :param refresh: () -> str，重新解析下载地址，失败返回空字符串
+        """
+        self._url = url
+        self._refresh = refresh
+        self._lock = Lock()
+
+    @property
+    def url(self) -> str:
+        return self._url
+
+    def refresh(self, old_url) -> bool:
+        """old_url 失效，获取新的地址，返回是否可以重试"""
+        if not self._refresh:
+            return False
+        with self._lock:
+            if self._url == old_url:  # 其它分段还没有刷新过
+                url = self._refresh()
+                if not url:
+                    return False
+                logger.debug(f"Down link: link expired, refreshed {urlparse(url).netloc}")
+                self._url = url
+        return True
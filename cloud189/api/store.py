@@ -0,0 +1,74 @@
+"""
+上传状态本地存储：保存未完成的上传任务，重新上传时向服务器查询已接收的字节数，从断点继续
+"""
+
+import os
+import json
+from time import time
+from threading import Lock
+
+from cloud189.api.utils import logger, ROOT_DIR
+
+__all__ = ['UploadStateStore', 'up_state_store']
+
+
+class UploadStateStore:
+    """未完成的上传任务 {文件路径|大小|修改时间|目标文件夹: {upload_file_id, upload_url, commit_url, time}}"""
+
+    TTL = 7 * 24 * 3600  # 服务器保留未完成上传任务的时间未知，超过一周不再续传
+
+    def __init__(self, path=ROOT_DIR + os.sep + '.upload-state.json'):
+        self._path = path
+        self._states = None  # 第一次使用时读取
+        self._lock = Lock()
+
+    @staticmethod
+    def key(file_path, folder_id) -> str:
+        """文件路径、大小、修改时间、目标文件夹都不变时才能续传"""
+        stat = os.stat(file_path)
+        return f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{folder_id}"
+
+    def _load(self):
+        if self._states is not None:
+            return None
+        self._states = {}
+        if not os.path.exists(self._path):
+            return None
+        try:
+            with open(self._path, 'r', encoding='utf-8') as f:
+                self._states = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.debug(f"Upload state: broken state file {self._path=}, {e=}")
+        now = time()
+        self._states = {k: v for k, v in self._states.items() if now - v.get('time', 0) < self.TTL}
+
+    def _save(self):
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._states, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path)
+
+    def get(self, key) -> dict:
+        """获取未完成的上传任务，没有返回 None"""
+        with self._lock:
+            self._load()
+            return self._states.get(key)
+
+    def put(self, key, upload_file_id, upload_url, commit_url):
+        """记录新建的上传任务"""
+        with self._lock:
+            self._load()
+            self._states[key] = {'upload_file_id': str(upload_file_id), 'upload_url': upload_url,
+                                 'commit_url': commit_url, 'time': time()}
+            self._save()
+
+    def remove(self, key):
+        """上传完成或任务失效"""
+        with self._lock:
+            self._load()
+            if self._states.pop(key, None) is not None:
+                self._save()
+
+
+# 全局上传状态
+up_state_store = UploadStateStore()
@@ -6,14 +6,14 @@ from collections import namedtuple
 
 
 __all__ = ['FileInfo', 'RecInfo', 'PathInfo', 'UpCode', 'MkCode', 'UpInfo',
-           'ShareCode', 'FolderTree', 'ShareInfo', 'UserInfo']
+           'ShareCode', 'FolderTree', 'ShareInfo', 'UserInfo', 'MirrorPlan', 'LocalFile']
 
 
 _base_info = ['name', 'id', 'pid', 'ctime', 'optime', 'size', 'ftype', 'isFolder', 'durl']
-_file_info = (*_base_info, 'isStarred', 'account', 'count')
+_file_info = (*_base_info, 'isStarred', 'account', 'count', 'md5')
 _rec_info = [*_base_info, 'isFamily', 'path', 'fid']
 _share_info = ['pwd', 'copyC', 'downC', 'prevC', 'url', 'path',
-               'need_pwd', 's_type', 's_mode', 'r_stat', *_base_info]
+               'need_pwd', 's_type', 's_mode', 'r_stat', 'verify', *_base_info]
 
 # 主文件
 FileInfo = namedtuple('FileInfo', _file_info, defaults=('',) * len(_file_info))
@@ -32,5 +32,15 @@ ShareInfo = namedtuple('ShareInfo', _share_info, defaults=('',) * len(_share_inf
 UserInfo = namedtuple('UserInfo', ['id', 'account', 'nickname', 'used', 'quota', 'vip', 'endTime',
                                    'beginTime', 'domain'], defaults=('',) * 9)
 
-UpInfo = namedtuple('UpInfo', ['name', 'path', 'id', 'fid', 'size', 'force', 'exist', 'check', 'callback'],
-                    defaults=('', '', '', '-11', 0, False, False, True, None))
+# 遍历本地文件夹得到的文件：路径、文件名、大小、修改时间(ns)、目标文件夹 id、是否为打包上传的文件夹
+LocalFile = namedtuple('LocalFile', ['path', 'name', 'size', 'mtime', 'fid', 'pack'],
+                       defaults=('', '', 0, 0, '-11', False))
+
+# stream 为打包等方式生成的上传数据(可读文件对象)，为 None 时读取 path
+UpInfo = namedtuple('UpInfo', ['name', 'path', 'id', 'fid', 'size', 'force', 'exist', 'check', 'callback', 'md5',
+                               'stream'],
+                    defaults=('', '', '', '-11', 0, False, False, True, None, '', None))
+
+# 镜像计划：新增、变化的文件 [(相对路径, FileInfo)]，需要删除的本地文件 [相对路径]，未变化的文件数，需要下载的字节数
+MirrorPlan = namedtuple('MirrorPlan', ['new', 'changed', 'deleted', 'unchanged', 'size'],
+                        defaults=([], [], [], 0, 0))
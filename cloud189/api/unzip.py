@@ -0,0 +1,217 @@
+"""
+流式解压：下载 zip 的同时解析本地文件头，直接把文件写入目标文件夹，不保存中间压缩包
+
+支持 stored/deflate 压缩、数据描述符(flag bit 3)、zip64，文件名为 utf-8 或 gbk 编码
+stored 且使用数据描述符的文件(写入不可 seek 的流时生成)通过描述符签名查找数据结尾，要求描述符带有签名
+"""
+
+import os
+import zlib
+import struct
+
+from cloud189.api.utils import logger, safe_join, ChunkReader
+from cloud189.api.writer import FileWriter
+
+__all__ = ['ZipStreamExtractor']
+
+LOCAL_HEADER_SIG = 0x04034b50
+CENTRAL_DIR_SIG = 0x02014b50
+END_OF_DIR_SIG = 0x06054b50
+ZIP64_END_SIG = 0x06064b50
+DESCRIPTOR_SIG = 0x08074b50
+
+STORED = 0
+DEFLATED = 8
+
+FLAG_DESCRIPTOR = 1 << 3  # 大小、crc 保存在数据之后
+FLAG_UTF8 = 1 << 11
+
+
+class ZipStreamExtractor:
+    """zip 流式解压器"""
+
+    BLOCK = 1 << 20
+
+    def __init__(self, save_path, callback=None):
+        """
+        :param save_path: 解压到的文件夹
+        :param callback: 每个文件的解压进度 (文件名, 文件大小(未知为 -1), 已写入大小)
+        """
+        self._save_path = os.path.abspath(save_path)
+        self._callback = callback
+        self.files = 0  # 解压的文件数
+        self.size = 0  # 解压后的总大小
+
+    @staticmethod
+    def _decode_name(raw, flags) -> str:
+        if flags & FLAG_UTF8:
+            return raw.decode('utf-8', errors='replace')
+        for encoding in ('utf-8', 'gbk'):
+            try:
+                return raw.decode(encoding)
+            except UnicodeDecodeError:
+                pass
+        return raw.decode('cp437')
+
+    @staticmethod
+    def _zip64_extra(extra):
+        """查找 zip64 扩展字段，没有返回 None"""
+        pos = 0
+        while pos + 4 <= len(extra):
+            tag, length = struct.unpack('<HH', extra[pos:pos + 4])
+            if tag == 0x0001:
+                return extra[pos + 4:pos + 4 + length]
+            pos += 4 + length
+        return None
+
+    @staticmethod
+    def _zip64_sizes(values, csize, usize) -> (int, int):
+        """从 zip64 扩展字段读取真实大小，只有值为 0xFFFFFFFF 的字段会出现在扩展字段中"""
+        offset = 0
+        if usize == 0xFFFFFFFF and offset + 8 <= len(values):
+            usize = struct.unpack('<Q', values[offset:offset + 8])[0]
+            offset += 8
+        if csize == 0xFFFFFFFF and offset + 8 <= len(values):
+            csize = struct.unpack('<Q', values[offset:offset + 8])[0]
+        return csize, usize
+
+    def _read_descriptor(self, reader, is_zip64) -> int:
+        """读取数据描述符，返回 crc"""
+        head = reader.read(4)
+        if struct.unpack('<I', head)[0] == DESCRIPTOR_SIG:
+            head = reader.read(4)
+        crc = struct.unpack('<I', head)[0]
+        reader.read(16 if is_zip64 else 8)
+        return crc
+
+    def _iter_raw(self, reader, name, size):
+        """读取压缩数据，size 为 -1 时一直读取，由调用者(解压器)判断结束"""
+        left = size
+        while left != 0:
+            data = reader.read_some(self.BLOCK if left < 0 else min(left, self.BLOCK))
+            if not data:
+                raise EOFError(f"unexpected end of zip stream in {name!r}")
+            if left > 0:
+                left -= len(data)
+            yield data
+
+    def _iter_stored(self, reader, name, is_zip64):
+        """读取大小未知的 stored 数据，直到数据描述符(退回给 reader，之后由 _read_descriptor 读取)
+        数据中可能恰好出现描述符签名，只有描述符中的 crc、大小与之前的数据一致时才是结尾
+        """
+        sig = struct.pack('<I', DESCRIPTOR_SIG)
+        desc_len, size_fmt = (24, '<QQ') if is_zip64 else (16, '<II')
+        buf = b''
+        size = 0
+        crc = 0
+        while True:
+            pos = buf.find(sig)
+            while pos >= 0 and len(buf) - pos >= desc_len:
+                _crc = struct.unpack('<I', buf[pos + 4:pos + 8])[0]
+                csize, usize = struct.unpack(size_fmt, buf[pos + 8:pos + desc_len])
+                if csize == usize == size + pos and zlib.crc32(buf[:pos], crc) == _crc:
+                    reader.unread(buf[pos:])
+                    if pos:
+                        yield buf[:pos]
+                    return None
+                pos = buf.find(sig, pos + 1)
+            keep = pos if pos >= 0 else max(len(buf) - len(sig) + 1, 0)  # 可能是描述符开头的数据先保留
+            if keep:
+                data, buf = buf[:keep], buf[keep:]
+                crc = zlib.crc32(data, crc)
+                size += len(data)
+                yield data
+            data = reader.read_some(self.BLOCK)
+            if not data:
+                raise EOFError(f"unexpected end of zip stream in {name!r}")
+            buf += data
+
+    def _notify(self, name, total, now):
+        if self._callback:
+            self._callback(name, total, now)
+
+    def _extract_entry(self, reader, name, path, method, flags, crc, csize, usize, is_zip64):
+        """解压一个文件，path 为 None 时只跳过数据"""
+        known = not flags & FLAG_DESCRIPTOR
+        if method not in (STORED, DEFLATED):
+            raise ValueError(f"unsupported compress method {method} of {name!r}")
+        total = usize if known else -1
+        now = 0
+        _crc = 0
+        decompressor = zlib.decompressobj(-15) if method == DEFLATED else None
+        if path is None:
+            writer = None
+        else:
+            folder = os.path.dirname(path)
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            writer = FileWriter(path, total, truncate=True).open()
+        if method == STORED and not known:
+            chunks = self._iter_stored(reader, name, is_zip64)
+        else:
+            chunks = self._iter_raw(reader, name, csize if known else -1)
+        try:
+            for data in chunks:
+                if decompressor:
+                    out = decompressor.decompress(data)
+                    if decompressor.eof:
+                        reader.unread(decompressor.unused_data)
+                else:
+                    out = data
+                if out:
+                    _crc = zlib.crc32(out, _crc)
+                    now += len(out)
+                    if writer:
+                        writer.write(out)
+                        self._notify(name, total, now)
+                if decompressor and decompressor.eof:
+                    break
+        finally:
+            if writer:
+                writer.close(sync=False)  # 每个文件都 fsync 会让大量小文件的解压非常慢
+        if not known:
+            crc = self._read_descriptor(reader, is_zip64)
+        if _crc != crc:
+            raise ValueError(f"crc mismatch {name!r}")
+        if path is None:
+            return None
+        self._notify(name, now, now)
+        self.files += 1
+        self.size += now
+
+    def extract(self, chunks) -> int:
+        """解压数据流
+        :param chunks: 数据块迭代器，如 resp.iter_content()
+        :return: 解压的文件数
+        """
+        reader = ChunkReader(chunks)
+        while True:
+            try:
+                sig = struct.unpack('<I', reader.read(4))[0]
+            except EOFError:
+                break
+            if sig in (CENTRAL_DIR_SIG, END_OF_DIR_SIG, ZIP64_END_SIG):  # 文件数据结束，中央目录不需要
+                break
+            if sig != LOCAL_HEADER_SIG:
+                raise ValueError(f"bad zip signature {sig:#x} at {reader.read_size}")
+            _, flags, method, _, _, crc, csize, usize, name_len, extra_len = \
+                struct.unpack('<HHHHHIIIHH', reader.read(26))
+            name = self._decode_name(reader.read(name_len), flags)
+            extra = reader.read(extra_len)
+            zip64 = self._zip64_extra(extra)
+            is_zip64 = zip64 is not None  # 数据描述符中的大小为 8 字节
+            if is_zip64:
+                csize, usize = self._zip64_sizes(zip64, csize, usize)
+            path = safe_join(self._save_path, name)
+            if name.endswith('/'):  # 文件夹，可能带有空的压缩数据
+                if not os.path.exists(path):
+                    os.makedirs(path)
+                if flags & FLAG_DESCRIPTOR:
+                    self._extract_entry(reader, name, None, method, flags, crc, csize, usize, is_zip64)
+                else:
+                    reader.read(csize)
+                continue
+            logger.debug(f"Unzip: {name=}, {method=}, {flags=}, {csize=}, {usize=}")
+            self._extract_entry(reader, name, path, method, flags, crc, csize, usize, is_zip64)
+        logger.debug(f"Unzip: finished {self.files=}, {self.size=}, read={reader.read_size}")
+        return self.files
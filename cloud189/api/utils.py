@@ -5,15 +5,20 @@ API 处理网页数据、数据切片时使用的工具
 import os
 import logging
 import hmac
+import mmap
 import hashlib
+import sqlite3
+from time import monotonic
+from collections import deque
+from threading import Lock
 from datetime import datetime
 from base64 import b64encode
 import rsa
 
 __all__ = ['logger', 'encrypt', 'b64tohex', 'calculate_hmac_sign',
-           'API', 'UA', 'SUFFIX_PARAM', 'get_time', 'get_file_md5',
-           'get_file_name', 'get_relative_folder', 'get_upload_chunks',
-           'get_chunk_size']
+           'API', 'UA', 'SUFFIX_PARAM', 'get_time', 'get_file_md5', 'md5_cache',
+           'get_file_name', 'scan_dir', 'get_chunk_size', 'ChunkSizer',
+           'BufferReader', 'hash_file']
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIR = os.path.dirname(os.path.dirname(ROOT_DIR))
@@ -120,17 +125,86 @@ def get_time(stamp=False):
         return datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S GMT')
 
 
+class Md5Cache:
+    """文件 md5 持久缓存(sqlite)，以 (设备, inode) 为键，大小与修改时间(ns)不变时直接使用缓存"""
+
+    def __init__(self, path=ROOT_DIR + os.sep + '.md5-cache.sqlite'):
+        self._path = path
+        self._conn = None
+        self._disabled = False
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self._conn is None and not self._disabled:
+            try:
+                self._conn = sqlite3.connect(self._path, check_same_thread=False)
+                self._conn.execute('CREATE TABLE IF NOT EXISTS md5_cache (dev INTEGER, inode INTEGER, size INTEGER, '
+                                   'mtime_ns INTEGER, path TEXT, md5 TEXT, PRIMARY KEY (dev, inode))')
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Md5 cache: cannot open {self._path=}, {e=}")
+                self._disabled = True
+                self._conn = None
+        return self._conn
+
+    @staticmethod
+    def _key(stat) -> tuple:
+        return stat.st_dev, stat.st_ino
+
+    def get(self, file_path, stat=None) -> str:
+        """查询缓存，文件发生变化或没有缓存时返回空字符串"""
+        stat = stat or os.stat(file_path)
+        if not stat.st_ino:  # 文件系统不支持 inode
+            return ''
+        with self._lock:
+            conn = self._connect()
+            row = None
+            if conn:
+                try:
+                    row = conn.execute('SELECT size, mtime_ns, md5 FROM md5_cache WHERE dev=? AND inode=?',
+                                       self._key(stat)).fetchone()
+                except sqlite3.Error as e:
+                    logger.error(f"Md5 cache: query failed {e=}")
+            if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+                self.hits += 1
+                logger.debug(f"Md5 cache: hit {file_path=}, hits={self.hits}, misses={self.misses}")
+                return row[2]
+            self.misses += 1
+            logger.debug(f"Md5 cache: miss {file_path=}, hits={self.hits}, misses={self.misses}")
+            return ''
+
+    def put(self, file_path, md5, stat=None):
+        """保存文件 md5，stat 应为计算 md5 之前获取的状态，避免计算过程中文件被修改"""
+        stat = stat or os.stat(file_path)
+        if not stat.st_ino:
+            return None
+        with self._lock:
+            conn = self._connect()
+            if not conn:
+                return None
+            try:
+                conn.execute('INSERT OR REPLACE INTO md5_cache VALUES (?, ?, ?, ?, ?, ?)',
+                             (*self._key(stat), stat.st_size, stat.st_mtime_ns, os.path.abspath(file_path), md5))
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Md5 cache: save failed {e=}")
+
+
+# 全局 md5 缓存
+md5_cache = Md5Cache()
+
+
 def get_file_md5(file_path, check=True):
     if check:
-        _md5 = hashlib.md5()
-        with open(file_path, 'rb') as f:
-            while True:
-                data = f.read(64 * 1024)
-                if not data:
-                    break
-                _md5.update(data)
-            hash_md5 = _md5.hexdigest()
-        return hash_md5.upper()
+        stat = os.stat(file_path)
+        hash_md5 = md5_cache.get(file_path, stat)
+        if hash_md5:
+            return hash_md5
+        hash_md5 = hash_file(file_path, stat.st_size).hexdigest().upper()
+        md5_cache.put(file_path, hash_md5, stat)
+        return hash_md5
     else:
         return 'random_md5_value'  # TODO: 这里需要返回一个值
 
@@ -140,24 +214,133 @@ def get_file_name(file_path):
     return file_path.strip('/').strip('\\').rsplit('\\', 1)[-1].rsplit('/', 1)[-1]
 
 
-def get_relative_folder(full_path, work_path, is_file=True):
-    '''文件路径获取文件夹'''
-    work_name = get_file_name(work_path)
-    # 有可能 work_name 在父文件夹中有出现，
-    # 因此 反转路径 以替换最后一个文件(夹)名，最后再倒回来 (〒︿〒)
-    work_hone = work_path[::-1].strip('/').strip('\\').replace(work_name[::-1], '', 1)[::-1]
-    relative_path = full_path.strip('/').strip('\\').replace(work_hone, '')
-    file_name = relative_path.rsplit('\\', 1)[-1].rsplit('/', 1)[-1] if is_file else ''
-    logger.debug(f"{work_name=},{work_hone=},{relative_path=},{file_name=}")
-    return relative_path.replace(file_name, '').strip('/').strip('\\')
-
-
-def get_upload_chunks(file, chunk_size=8096):
-    """文件上传 块生成器"""
-    while True:
-        data = file.read(chunk_size)
-        if not data: break
-        yield data
+def scan_dir(folder_path):
+    """使用 os.scandir 广度优先遍历文件夹，边遍历边产生结果，不需要等整个文件夹遍历完
+    每个文件夹产生一次 (相对路径, [子文件夹名], [(文件路径, 文件名, 大小, 修改时间 ns)])，根目录相对路径为 ''
+    文件大小、修改时间来自 DirEntry 的缓存，不再单独 stat；调用者可以从子文件夹列表中删除不需要进入的文件夹
+    不进入指向文件夹的符号链接(与 os.walk 默认行为一致)
+    """
+    prefix = folder_path.rstrip(os.sep) + os.sep  # 拼接路径，不用每次 os.path.join/relpath
+    queue = deque([''])
+    while queue:
+        rel_dir = queue.popleft()
+        dirs, files = [], []
+        try:
+            with os.scandir(prefix + rel_dir if rel_dir else folder_path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            dirs.append(entry.name)
+                        elif entry.is_file():
+                            stat = entry.stat()
+                            files.append((entry.path, entry.name, stat.st_size, stat.st_mtime_ns))
+                    except OSError as e:  # 遍历过程中文件被删除、没有权限
+                        logger.error(f"Scan dir: skip {entry.path=}, {e=}")
+        except OSError as e:
+            logger.error(f"Scan dir: can not open {rel_dir=} in {folder_path=}, {e=}")
+            continue
+        yield rel_dir, dirs, files
+        queue.extend(rel_dir + os.sep + name if rel_dir else name for name in dirs)
+
+
+def safe_join(root, name) -> str:
+    """压缩包内的路径转换为 root 下的本地路径，拒绝 ../ 与绝对路径"""
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.')]
+    if not parts or '..' in parts or ':' in parts[0]:
+        raise ValueError(f"illegal path in archive: {name!r}")
+    return os.path.join(root, *parts)
+
+
+class ChunkReader:
+    """把 iter_content 的数据块包装成可以按字节数读取的流，用于边下载边解压、解包"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = b''
+        self.read_size = 0  # 已从网络读取的字节数
+
+    def _fill(self) -> bool:
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        self.read_size += len(chunk)
+        self._buf = self._buf + chunk if self._buf else chunk
+        return True
+
+    def read(self, size) -> bytes:
+        """读取 size 字节，数据不足时抛出 EOFError"""
+        while len(self._buf) < size:
+            if not self._fill():
+                raise EOFError(f"unexpected end of stream, need {size} bytes")
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+    def read_some(self, size) -> bytes:
+        """读取至多 size 字节，流结束时返回 b''"""
+        if not self._buf and not self._fill():
+            return b''
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+    def unread(self, data):
+        """退回多读的数据"""
+        if data:
+            self._buf = data + self._buf
+
+
+class BufferReader:
+    """复用缓冲区的文件读取器：readinto 到预分配的 bytearray，返回 memoryview 切片
+    下一次读取会覆盖上一次返回的数据，调用者必须在读取下一块之前用完(发送、计算 md5)
+    """
+
+    def __init__(self, file, size=1 << 20):
+        self._file = file
+        self._buf = bytearray(size)
+
+    def read(self, size) -> memoryview:
+        """读取至多 size 字节，文件结束时返回空的 memoryview"""
+        if size > len(self._buf):  # 块大小变大时重新分配，之前返回的切片仍然有效
+            self._buf = bytearray(size)
+        view = memoryview(self._buf)[:size]
+        got = 0
+        while got < size:  # readinto 可能读不满
+            n = self._file.readinto(view[got:])
+            if not n:
+                break
+            got += n
+        return view[:got]
+
+    def __iter__(self):
+        while True:
+            data = self.read(len(self._buf))
+            if not data:
+                break
+            yield data
+
+
+MMAP_THRESHOLD = 64 << 20  # 大于 64MB 的文件使用 mmap 计算 md5
+HASH_BLOCK = 8 << 20
+
+
+def hash_file(file_path, size=-1, hash_obj=None):
+    """计算文件哈希(默认 md5)，大文件使用 mmap 避免复制，小文件复用同一个缓冲区"""
+    hash_obj = hash_obj or hashlib.md5()
+    size = os.path.getsize(file_path) if size < 0 else size
+    with open(file_path, 'rb') as f:
+        mapped = None
+        if size >= MMAP_THRESHOLD:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:  # 不支持 mmap 的文件系统
+                logger.debug(f"Hash file: mmap failed {file_path=}, {e=}")
+        if mapped is not None:
+            with mapped, memoryview(mapped) as data:
+                for offset in range(0, len(data), HASH_BLOCK):
+                    hash_obj.update(data[offset:offset + HASH_BLOCK])
+            return hash_obj
+        for data in BufferReader(f):
+            hash_obj.update(data)
+    return hash_obj
 
 
 def get_chunk_size(total_size: int) -> int:
@@ -170,3 +353,83 @@ def get_chunk_size(total_size: int) -> int:
         return 100 << 10  # 100 KB
     else:
         return 1 << 20  # 1 MB
+
+
+class ChunkSizer:
+    """根据实测速度自适应调整块大小
+    每块耗时远小于 TARGET 时增大块，远大于时减小块，范围 [MIN_SIZE, MAX_SIZE]
+    """
+
+    MIN_SIZE = 64 << 10  # 64 KB
+    MAX_SIZE = 16 << 20  # 16 MB
+    TARGET = 0.25  # 每块期望耗时(秒)
+
+    def __init__(self, total_size=-1, name='', limiter=None):
+        """
+        :param total_size: 传输总大小
+        :param name: 调试日志中显示的名字
+        :param limiter: 限速器 RateLimiter，等待时间不计入块耗时
+        """
+        self.size = get_chunk_size(total_size)
+        self._name = name
+        self._limiter = limiter
+        self._bytes = 0
+        self._elapsed = 0.0
+        self._rate = 0.0  # 平滑后的速度 bytes/s
+
+    def update(self, nbytes, elapsed):
+        """记录一块的大小与耗时，并调整下一块的大小"""
+        self._bytes += nbytes
+        self._elapsed += elapsed
+        if nbytes <= 0 or elapsed <= 0:
+            return None
+        rate = nbytes / elapsed
+        self._rate = rate if not self._rate else self._rate * 0.7 + rate * 0.3
+        if elapsed < self.TARGET / 4 and nbytes >= self.size:
+            size = min(self.size * 2, self.MAX_SIZE)
+        elif elapsed > self.TARGET * 4:
+            size = max(self.size // 2, self.MIN_SIZE)
+        else:
+            return None
+        if size != self.size:
+            logger.debug(f"Chunk size: {self._name} {self.size} -> {size}, rate={self._rate / 1024:.1f}KB/s, "
+                         f"latency={elapsed * 1000:.1f}ms")
+            self.size = size
+
+    def summary(self):
+        """传输结束后记录平均速度"""
+        if self._elapsed > 0:
+            logger.debug(f"Chunk size: {self._name} finished {self._bytes=}, "
+                         f"avg={self._bytes / self._elapsed / 1024:.1f}KB/s, last size={self.size}")
+
+    def iter_content(self, resp, limit=-1):
+        """读取下载响应体，limit 为最多读取的字节数"""
+        while limit != 0:
+            size = self.size if limit < 0 else min(self.size, limit)
+            start = monotonic()
+            data = resp.raw.read(size, decode_content=True)
+            if not data:
+                break
+            self.update(len(data), monotonic() - start)
+            if self._limiter:
+                self._limiter.consume(len(data))
+            if limit > 0:
+                limit -= len(data)
+            yield data
+        self.summary()
+
+    def iter_file(self, file):
+        """读取上传文件，耗时包括上一块的发送时间
+        返回的 memoryview 在下一次迭代时被覆盖，调用者需要在迭代下一块之前发送完"""
+        start = monotonic()
+        reader = BufferReader(file, self.size)
+        while True:
+            data = reader.read(self.size)  # 复用缓冲区，发送完才会读取下一块
+            if not data:
+                break
+            waited = self._limiter.consume(len(data)) if self._limiter else 0
+            yield data
+            now = monotonic()
+            self.update(len(data), now - start - waited)
+            start = now
+        self.summary()
@@ -1,4 +1,5 @@
 import os
+import sys
 from time import sleep
 from getpass import getpass
 from random import choice
@@ -9,9 +10,10 @@ from cloud189.api import Cloud189
 from cloud189.api.models import FileList, PathList
 from cloud189.api.token import get_token
 from cloud189.api.utils import logger
+from cloud189.api.limiter import up_limiter, down_limiter
 
 from cloud189.cli import config
-from cloud189.cli.downloader import Downloader, Uploader
+from cloud189.cli.downloader import Downloader, Uploader, DownType
 from cloud189.cli.manager import global_task_mgr
 from cloud189.cli.recovery import Recovery
 from cloud189.cli.utils import *
@@ -399,11 +401,16 @@ class Commander:
         """自动选择下载方式"""
         task_flag = False
         follow = False
-        for arg in args:
-            if arg == '-f':
-                follow = True
+        threads = 1
+        zip_ = False
+        extract = False
+        for arg in args[:]:
+            follow, threads, zip_, extract, match = parsing_down_params(arg, follow, threads, zip_, extract)
+            if match:
                 args.remove(arg)
-        # TODO: 通过分享链接下载
+        # 批量下载时，提前并发解析所有文件的下载地址
+        file_ids = [file.id for file in self._file_list if file.name in args and not file.isFolder]
+        self._disk.prefetch_down_urls(file_ids)
         i = 0
         while i < len(args):
             item = args[i]
@@ -412,16 +419,27 @@ class Commander:
                 if i < len(args) - 1 and (not args[i + 1].startswith("http")):
                     pwd = args[i + 1]
                     i += 1  # 额外加一
-                self._disk.get_file_info_by_url(item, pwd)
+                downloader = Downloader(self._disk)
+                downloader.set_url(item, pwd)
+                downloader.set_threads(threads)
+                if downloader.get_down_type() == DownType.INVALID_URL:
+                    error(f'分享链接无效: {item}')
+                else:
+                    task_flag = True
+                    self._task_mgr.add_task(downloader)  # 提交下载任务
             elif file := self._file_list.find_by_name(item):
                 downloader = Downloader(self._disk)
                 f_path = '/'.join(self._path_list.all_name)  # 文件在网盘的父路径
-                if file.isFolder:  # 使用 web 接口打包下载文件夹
+                if file.isFolder:  # 递归下载文件夹，或使用 web 接口打包下载
                     downloader.set_fid(file.id, is_file=False, f_path=f_path, f_name=item)
+                    downloader.set_threads(threads)
+                    downloader.set_zip(zip_, extract)
                     task_flag = True
                     self._task_mgr.add_task(downloader)  # 提交下载任务
                 else:  # 下载文件
-                    downloader.set_fid(file.id, is_file=True, f_path=f_path, f_name=item)
+                    downloader.set_fid(file.id, is_file=True, f_path=f_path, f_name=item, md5=file.md5)
+                    downloader.set_threads(threads)
+                    downloader.set_zip(False, extract)
                     task_flag = True
                     self._task_mgr.add_task(downloader)  # 提交下载任务
             else:
@@ -432,6 +450,79 @@ class Commander:
         elif task_flag:
             print("开始下载, 输入 jobs 查看下载进度...")
 
+    def mirror(self, args):
+        """增量镜像文件夹到本地，只下载新增或变化的文件"""
+        follow, threads, dry_run, delete = False, 1, False, False
+        for arg in args[:]:
+            follow, threads, _, _, match = parsing_down_params(arg, follow, threads, False, False)
+            if arg in ('-n', '--dry-run'):  # 只显示镜像计划
+                dry_run = match = True
+            elif arg in ('-d', '--delete'):  # 删除远端不存在的本地文件
+                delete = match = True
+            if match:
+                args.remove(arg)
+        if not args:
+            info('参数：[-n/--dry-run] [-d/--delete] [-t4] 文件夹')
+            return None
+        task_flag = False
+        f_path = '/'.join(self._path_list.all_name)  # 文件夹在网盘的父路径
+        for item in args:
+            folder = self._file_list.find_by_name(item)
+            if not folder or not folder.isFolder:
+                error(f'文件夹不存在: {item}')
+                continue
+            if dry_run:
+                save_path = config.save_path + os.sep + f_path + os.sep + item
+                code, plan = self._disk.mirror_dir(folder.id, save_path, delete, dry_run=True)
+                if code != Cloud189.SUCCESS:
+                    error(f"生成镜像计划失败: {why_error(code)} -> {item}")
+                    continue
+                for mark, files in (('+', plan.new), ('~', plan.changed)):
+                    for rel_path, file in files:
+                        print(f"{mark} {os.path.join(rel_path, file.name)}  {get_file_size_str(file.size)}")
+                for key in plan.deleted:
+                    print(f"- {key}")
+                print(f"{item}: 新增 {len(plan.new)}，变化 {len(plan.changed)}，删除 {len(plan.deleted)}，"
+                      f"未变化 {plan.unchanged}，需要下载 {get_file_size_str(plan.size) or '0Bytes'}")
+                continue
+            downloader = Downloader(self._disk)
+            downloader.set_mirror(folder.id, f_path, item, delete)
+            downloader.set_threads(threads)
+            task_flag = True
+            self._task_mgr.add_task(downloader)  # 提交镜像任务
+        if follow and task_flag:
+            self.jobs(['-f', ])
+        elif task_flag:
+            print("开始镜像, 输入 jobs 查看下载进度...")
+
+    def cat(self, args):
+        """输出文件内容到标准输出，用于管道，如 main.py cat 文件名 -r0-1023 | head"""
+        start, end = 0, None
+        names = []
+        for arg in args:
+            if arg.startswith('-r') or arg.startswith('--range='):
+                byte_range = arg[8:] if arg.startswith('--range=') else arg[2:]
+                first, _, last = byte_range.partition('-')
+                if not first.isnumeric() or (last and not last.isnumeric()):
+                    print(f"字节范围无效: {byte_range}, 格式: -r起始-[结束]", file=sys.stderr)
+                    return None
+                start, end = int(first), int(last) if last else None
+            else:
+                names.append(arg)
+        if len(names) != 1:
+            print('参数：文件名/文件id [-r起始-[结束]]', file=sys.stderr)
+            return None
+        if file := self._file_list.find_by_name(names[0]):
+            fid = file.id
+        elif names[0].isnumeric():
+            fid = int(names[0])
+        else:
+            print(f"文件不存在: {names[0]}", file=sys.stderr)
+            return None
+        code = self._disk.cat_file_by_id(fid, start=start, end=end)
+        if code != Cloud189.SUCCESS:
+            print(f"读取文件失败: {why_error(code)} -> {names[0]}", file=sys.stderr)
+
     def jobs(self, args):
         """显示后台任务列表"""
         follow = False
@@ -456,11 +547,27 @@ class Commander:
         follow = False
         force = False
         mkdir = True
-        for arg in args:
-            follow, force, mkdir, match = parsing_up_params(arg, follow, force, mkdir)
+        workers = 3
+        pack = 0
+        name = ''  # 从标准输入上传时的文件名
+        if '--name' in args[:-1]:
+            i = args.index('--name')
+            name = args.pop(i + 1)
+            args.pop(i)
+        for arg in args[:]:
+            follow, force, mkdir, workers, pack, match = parsing_up_params(arg, follow, force, mkdir, workers, pack)
+            if arg.startswith('--name='):
+                name = arg[7:]
+                match = True
+            elif arg.startswith('--parts=') and arg[8:].isnumeric():  # 大文件分片并行上传
+                self._disk.set_upload_parts(int(arg[8:]))
+                match = True
             if match:
                 args.remove(arg)
         for path in args:
+            if path == '-':
+                self._upload_stdin(name)
+                continue
             path = path.strip('\"\' ')  # 去除直接拖文件到窗口产生的引号
             if not os.path.exists(path):
                 error(f'该路径不存在哦: {path}')
@@ -470,6 +577,8 @@ class Commander:
                 uploader.set_upload_path(path, is_file=True, force=force)
             else:
                 uploader.set_upload_path(path, is_file=False, force=force, mkdir=mkdir)
+                uploader.set_workers(workers)
+                uploader.set_pack(pack)
             uploader.set_target(self._work_id, self._work_name)
             self._task_mgr.add_task(uploader)
             task_flag = True
@@ -478,6 +587,18 @@ class Commander:
         elif task_flag:
             print("开始上传, 输入 jobs 查看上传进度...")
 
+    def _upload_stdin(self, name):
+        """从标准输入读取数据直接上传(前台运行)，如 mysqldump db | gzip | main.py upload - --name db.sql.gz"""
+        if not name:
+            error('从标准输入上传需要使用 --name 指定网盘中的文件名')
+            return None
+        chunks = iter(lambda: sys.stdin.buffer.read(1 << 20), b'')
+        result = self._disk.upload_stream(chunks, name, self._work_id)
+        if result.code == Cloud189.SUCCESS:
+            info(f"上传完成: {name}")
+        else:
+            error(f"上传失败: {why_error(result.code)} -> {name}")
+
     def share(self, args):
         """分享文件"""
         name = args[0]
@@ -569,6 +690,22 @@ class Commander:
         else:
             error('路径非法,取消修改')
 
+    def limit(self, args):
+        """查看、设置上传下载限速"""
+        limiters = {'up': up_limiter, 'down': down_limiter}
+        if len(args) == 2 and args[0] in limiters:
+            rate = parse_size_str(args[1])
+            if rate < 0:
+                error(f"限速值无效: {args[1]}")
+                return None
+            limiters[args[0]].set_rate(rate)
+        elif args:
+            info('参数：[up/down 速度]，如 limit up 20M，速度为 0 表示不限速')
+            return None
+        for name, text in (('up', '上传'), ('down', '下载')):
+            rate = limiters[name].rate
+            print(f"{text}限速: {get_file_size_str(rate) + '/s' if rate else '不限速'}")
+
     def ll(self, args):
         """列出文件(夹)，详细模式"""
         if choice((0, 1, 0)):  # 1/3 概率刷新
@@ -603,9 +740,9 @@ class Commander:
         """运行单任务入口"""
         no_arg_cmd = ['help', 'update', 'who', 'quota']
         cmd_with_arg = ['ls', 'll', 'down', 'mkdir', 'su', 'sign', 'logout',
-                        'mv', 'rename', 'rm', 'share', 'upload']
+                        'mv', 'rename', 'rm', 'share', 'upload', 'cat', 'mirror']
 
-        if cmd in ("upload", "down"):
+        if cmd in ("upload", "down", "mirror"):
             if "-f" not in args:
                 args.append("-f")
 
@@ -621,7 +758,8 @@ class Commander:
         no_arg_cmd = ['bye', 'exit', 'cdrec', 'clear', 'clogin', 'help', 'r', 'c', 'b',
                       'refresh', 'rmode', 'setpath', 'update', 'who', 'quota']
         cmd_with_arg = ['ls', 'll', 'cd', 'down', 'jobs', 'shared', 'su', 'login', 'logout',
-                        'mkdir', 'mv', 'rename', 'rm', 'share', 'upload', 'sign', 'j', 'u', 'd']
+                        'mkdir', 'mv', 'rename', 'rm', 'share', 'upload', 'sign', 'limit', 'cat', 'mirror',
+                        'j', 'u', 'd']
 
         choice_list = [handle_name(i) for i in self._file_list.all_name]  # 引号包裹空格文件名
         cmd_list = no_arg_cmd + cmd_with_arg
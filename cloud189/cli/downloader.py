@@ -1,8 +1,9 @@
 from enum import Enum
 from threading import Thread
-from os import sep as os_sep
+from os import sep as os_sep, path as os_path
 
 from cloud189.api import Cloud189
+from cloud189.api.pack import PACK_SUFFIX
 from cloud189.cli import config
 from cloud189.cli.utils import why_error
 
@@ -20,6 +21,7 @@ class DownType(Enum):
     FOLDER_URL = 2
     FILE_ID = 3
     FOLDER_ID = 4
+    FOLDER_MIRROR = 5
 
 
 class Downloader(Thread):
@@ -32,8 +34,17 @@ class Downloader(Thread):
         self._pid = -1
         self._down_type = None
         self._down_args = None
+        self._pwd = ''  # 分享链接的提取码
+        self._share = None  # 分享页面的解析结果
         self._f_path = None
         self._f_name = ''
+        self._threads = 1  # 分段下载连接数
+        self._md5 = ''
+        self._zip = False  # 文件夹使用服务器打包下载
+        self._extract = False  # 打包下载时边下载边解压
+        self._delete = False  # 镜像时删除远端不存在的本地文件
+        self._done_files = 0  # for dir download
+        self._total_files = 0  # for dir download
         self._now_size = 0
         self._total_size = 1
         self._msg = ''  # 备用
@@ -60,8 +71,12 @@ class Downloader(Thread):
         return self._now_size, self._total_size, ''
 
     def get_count(self) -> (int, int):
-        """文件夹当前第几个文件(备用)"""
-        return 1, 0
+        """文件夹当前文件数量信息"""
+        return self._done_files, self._total_files
+
+    def get_down_type(self):
+        """获取下载类型"""
+        return self._down_type
 
     def get_cmd_info(self):
         """获取命令行的信息"""
@@ -71,27 +86,48 @@ class Downloader(Thread):
         """获取后台下载时保存的错误信息"""
         return self._err_msg
 
-    def set_url(self, url):
-        """设置 URL 下载任务"""
-        pass
-        '''
-        if is_file_url(url):  # 如果是文件
-            self._down_args = url
-            self._down_type = DownType.FILE_URL
-        elif is_folder_url(url):
-            self._down_args = url
-            self._down_type = DownType.FOLDER_URL
-        else:
+    def set_url(self, url, pwd=''):
+        """设置 URL 下载任务，解析一次分享页面判断是文件还是文件夹"""
+        self._down_args = url
+        self._pwd = pwd
+        self._f_path = ''
+        code, self._share = self._disk.get_file_info_by_url(url)
+        if code != Cloud189.SUCCESS:
+            self._f_name = url
             self._down_type = DownType.INVALID_URL
-        '''
+        else:
+            self._f_name = self._share.name
+            self._down_type = DownType.FOLDER_URL if self._share.isFolder else DownType.FILE_URL
 
-    def set_fid(self, fid, is_file=True, f_path=None, f_name=None):
+    def set_fid(self, fid, is_file=True, f_path=None, f_name=None, md5=''):
         """设置 id 下载任务"""
         self._down_args = fid
+        self._md5 = md5  # 文件 md5，用于校验
         self._f_path = f_path  # 文件(夹)名在网盘的父路径
         self._f_name = f_name  # 文件(夹)名在网盘的名字
         self._down_type = DownType.FILE_ID if is_file else DownType.FOLDER_ID
 
+    def set_mirror(self, fid, f_path, f_name, delete=False):
+        """设置文件夹增量镜像任务
+        :param delete: 删除远端已经不存在的本地文件
+        """
+        self._down_args = fid
+        self._f_path = f_path
+        self._f_name = f_name
+        self._delete = delete
+        self._down_type = DownType.FOLDER_MIRROR
+
+    def set_threads(self, threads=1):
+        """设置分段下载连接数"""
+        self._threads = threads
+
+    def set_zip(self, zip_=False, extract=False):
+        """文件夹使用服务器打包下载(不能断点续传)
+        :param extract: 边下载边解压，不保存压缩包；下载打包上传的 .tar 文件时边下载边解包
+        """
+        self._zip = zip_
+        self._extract = extract
+
     def _show_progress(self, file_name, total_size, now_size, msg=''):
         """更新下载进度的回调函数"""
         self._total_size = total_size
@@ -105,46 +141,60 @@ class Downloader(Thread):
         else:
             self._error_msg(f"文件下载失败: {why_error(code)} -> 文件名: {file.name}, ID: {file.id}")
 
+    def _set_dir_count(self, done_files, total_files):
+        """文件夹中文件数量"""
+        self._done_files = done_files
+        self._total_files = total_files
+
     def run(self) -> None:
         if self._down_type == DownType.INVALID_URL:
             self._error_msg('(。>︿<) 该分享链接无效')
 
         elif self._down_type == DownType.FILE_URL:
-            code = self._disk.down_file_by_url(self._down_args, '', self._save_path, self._show_progress)
-            if code == Cloud189.LACK_PASSWORD:
-                pwd = input('输入该文件的提取码 : ') or ''
-                code2 = self._disk.down_file_by_url(self._down_args, str(pwd), self._save_path, self._show_progress)
-                if code2 != Cloud189.SUCCESS:
-                    self._error_msg(f"文件下载失败: {why_error(code2)} -> {self._down_args}")
-            elif code != Cloud189.SUCCESS:
+            code = self._disk.down_file_by_url(self._down_args, self._pwd, self._save_path, self._show_progress,
+                                               self._threads, self._share)
+            if code != Cloud189.SUCCESS:
                 self._error_msg(f"文件下载失败: {why_error(code)} -> {self._down_args}")
 
         elif self._down_type == DownType.FOLDER_URL:
-            code = self._disk.down_dir_by_url(self._down_args, '', self._save_path, callback=self._show_progress,
-                                              mkdir=True, failed_callback=self._show_down_failed)
-            if code == Cloud189.LACK_PASSWORD:
-                pwd = input('输入该文件夹的提取码 : ') or ''
-                code2 = self._disk.down_dir_by_url(self._down_args, str(pwd), self._save_path,
-                                                   callback=self._show_progress,
-                                                   mkdir=True, failed_callback=self._show_down_failed)
-                if code2 != Cloud189.SUCCESS:
-                    self._error_msg(f"文件夹下载失败: {why_error(code2)} -> {self._down_args}")
-            elif code != Cloud189.SUCCESS:
+            code = self._disk.down_dir_by_url(self._down_args, self._pwd, self._save_path, callback=self._show_progress,
+                                              mkdir=True, failed_callback=self._show_down_failed,
+                                              down_handler=self._set_dir_count, threads=self._threads,
+                                              share=self._share)
+            if code != Cloud189.SUCCESS:
                 self._error_msg(f"文件夹下载失败: {why_error(code)} -> {self._down_args}")
 
         elif self._down_type == DownType.FILE_ID:
             save_path = self._save_path + os_sep + self._f_path
-            code = self._disk.down_file_by_id(self._down_args, save_path, self._show_progress)
+            if self._extract and self._f_name.endswith(PACK_SUFFIX):
+                code = self._disk.down_pack_by_id(self._down_args, save_path, self._show_progress)
+            else:
+                code = self._disk.down_file_by_id(self._down_args, save_path, self._show_progress, self._threads,
+                                                  self._md5)
             if code != Cloud189.SUCCESS:
                 self._error_msg(f"文件下载失败: {why_error(code)} -> {self._f_path}")
 
         elif self._down_type == DownType.FOLDER_ID:
             save_path = self._save_path + os_sep + self._f_path + os_sep + self._f_name
-            code = self._disk.down_dirzip_by_id(self._down_args, save_path, callback=self._show_progress)
+            if self._zip:
+                code = self._disk.down_dirzip_by_id(self._down_args, save_path, callback=self._show_progress,
+                                                    extract=self._extract)
+            else:
+                code = self._disk.down_dir_by_id(self._down_args, save_path, callback=self._show_progress,
+                                                 failed_callback=self._show_down_failed,
+                                                 down_handler=self._set_dir_count, threads=self._threads)
             if code != Cloud189.SUCCESS:
                 self._error_msg(f"文件夹下载失败: {why_error(code)} -> {self._f_path} ")
 
 
+        elif self._down_type == DownType.FOLDER_MIRROR:
+            save_path = self._save_path + os_sep + self._f_path + os_sep + self._f_name
+            code, _ = self._disk.mirror_dir(self._down_args, save_path, self._delete, callback=self._show_progress,
+                                            failed_callback=self._show_down_failed,
+                                            down_handler=self._set_dir_count, threads=self._threads)
+            if code != Cloud189.SUCCESS:
+                self._error_msg(f"文件夹镜像失败: {why_error(code)} -> {self._f_path} ")
+
 class UploadType(Enum):
     """上传类型枚举类"""
     FILE = 0
@@ -169,6 +219,10 @@ class Uploader(Thread):
         self._mkdir = True  # for dir upload
         self._done_files = 0  # for dir upload
         self._total_files = 0  # for dir upload
+        self._running_files = 0  # for dir upload, 正在上传的文件数
+        self._workers = 3  # for dir upload, 同时上传的文件数
+        self._pack = 0  # for dir upload, -1 整个文件夹打包上传，大于 0 时打包不超过该大小的子文件夹
+        self._saved_size = 0  # 秒传节省的上传字节数
         self._err_msg = []
 
     def _error_msg(self, msg):
@@ -190,6 +244,14 @@ class Uploader(Thread):
         """文件夹当前文件数量信息"""
         return self._done_files, self._total_files
 
+    def get_running(self) -> int:
+        """文件夹正在上传的文件数"""
+        return self._running_files
+
+    def get_saved(self) -> int:
+        """秒传节省的上传字节数"""
+        return self._saved_size
+
     def get_cmd_info(self):
         return self._up_path, self._folder_name
 
@@ -203,6 +265,14 @@ class Uploader(Thread):
         self._mkdir = mkdir
         self._up_type = UploadType.FILE if is_file else UploadType.FOLDER
 
+    def set_workers(self, workers=3):
+        """设置文件夹同时上传的文件数"""
+        self._workers = workers
+
+    def set_pack(self, pack=0):
+        """设置文件夹打包上传"""
+        self._pack = pack
+
     def set_target(self, folder_id=-1, folder_name=''):
         """设置网盘保存文件夹信息"""
         self._folder_id = folder_id
@@ -217,20 +287,32 @@ class Uploader(Thread):
         """文件上传失败时的回调函数"""
         self._error_msg(f"上传失败: {why_error(code)} -> {filename}")
 
-    def _set_dir_count(self, done_files, total_files):
+    def _set_dir_count(self, done_files, total_files, running_files=0):
         """文件夹中文件数量"""
         self._done_files = done_files
         self._total_files = total_files
+        self._running_files = running_files
 
     def run(self) -> None:
         if self._up_type == UploadType.FILE:
             info = self._disk.upload_file(self._up_path, self._folder_id, callback=self._show_progress, force=self._force)
             if info.code != Cloud189.SUCCESS:
                 self._error_msg(f"上传失败: {why_error(info.code)} -> {self._up_path}")
+            elif info.quick_up:
+                self._saved_size = os_path.getsize(self._up_path)
+
+        elif self._up_type == UploadType.FOLDER and self._pack < 0:
+            info = self._disk.upload_pack(self._up_path, self._folder_id, self._force, callback=self._show_progress)
+            if info.code != Cloud189.SUCCESS:
+                self._error_msg(f"打包上传失败: {why_error(info.code)} -> {self._up_path}")
 
         elif self._up_type == UploadType.FOLDER:
             infos = self._disk.upload_dir(self._up_path, self._folder_id, self._force, self._mkdir,
                                           callback=self._show_progress, failed_callback=self._show_upload_failed,
-                                          up_handler=self._set_dir_count)
+                                          up_handler=self._set_dir_count, workers=self._workers,
+                                          pack_size=self._pack)
             if not isinstance(infos, list):  # 进入单文件上传之前就已经出错(创建文件夹失败！) UpCode or MkCode
                 self._error_msg(f"文件夹上传失败: {why_error(infos.code)} -> {self._up_path}")
+            else:  # 秒传(包括同一任务中内容相同的文件)节省的流量
+                self._saved_size = sum(os_path.getsize(info.path) for info in infos
+                                       if info.quick_up and os_path.isfile(info.path))
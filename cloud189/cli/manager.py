@@ -116,11 +116,15 @@ class TaskManager(object):
         if task.get_task_type() == TaskType.DOWNLOAD:
             d_arg, f_name = task.get_cmd_info()
             d_arg = f_name if isinstance(d_arg, int) else d_arg  # 显示 id 对应的文件名
-            result = f"[{pid}] Status: {status} | Process: {percent} | Download: {d_arg}"
+            done_files, total_files = task.get_count()
+            count = f" ({done_files}/{total_files})" if total_files > 0 else ""
+            result = f"[{pid}] Status: {status} | Process: {percent} | Download: {d_arg}{count}"
         else:
             up_path, folder_name = task.get_cmd_info()
             done_files, total_files = task.get_count()
+            running = task.get_running() if task.is_alive() else 0
             count = f" ({done_files}/{total_files})" if total_files > 0 else ""
+            count += f" [{running} 个文件上传中]" if running > 0 else ""
             proc = get_upload_status(msg, percent)
             result = f"[{pid}] Status: {status} | Process:{proc} | Speed: {sizeof_fmt(speed)}/s | Upload: {up_path}{count} -> {folder_name}"
 
@@ -164,6 +168,8 @@ class TaskManager(object):
                     while True:
                         if not task.is_alive():
                             OUTPUT_LIST.append(f"[{pid}] finished")
+                            if task.get_task_type() == TaskType.UPLOAD and task.get_saved() > 0:
+                                OUTPUT_LIST.append(f"[{pid}] 秒传节省: {sizeof_fmt(task.get_saved())}")
                             for err_msg in task.get_err_msg():
                                 OUTPUT_LIST.append(f"[{pid}] Error Messages: {err_msg}")
                             break
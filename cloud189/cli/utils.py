@@ -10,8 +10,8 @@ from cloud189.api.utils import ROOT_DIR
 from cloud189.api import Cloud189
 from cloud189.cli import version
 
-__all__ = ['error', 'info', 'clear_screen', 'get_file_size_str', 'parsing_up_params',
-           'check_update', 'handle_name', 'handle_args', 'captcha_handler',
+__all__ = ['error', 'info', 'clear_screen', 'get_file_size_str', 'parse_size_str', 'parsing_up_params', 'parsing_down_params',
+           'check_update', 'handle_name', 'handle_args', 'captcha_handler', 'why_error',
            'set_completer', 'print_help', 'check_update']
 
 GIT_REPO = "Aruelius/cloud189"
@@ -55,6 +55,20 @@ def get_file_size_str(filesize) -> str:
     else: return f"{filesize}Bytes"
 
 
+def parse_size_str(size: str) -> int:
+    """解析 512K、20M、1G 等大小字符串，返回字节数，无法解析时返回 -1"""
+    units = {'B': 0, 'K': 10, 'M': 20, 'G': 30, 'T': 40}
+    size = size.strip().upper().rstrip('B/S') or '0'
+    shift = 0
+    if size[-1] in units:
+        shift = units[size[-1]]
+        size = size[:-1]
+    try:
+        return int(float(size) * (1 << shift))
+    except ValueError:
+        return -1
+
+
 def why_error(code):
     """错误原因"""
     if code == Cloud189.URL_INVALID:
@@ -77,6 +91,10 @@ def why_error(code):
         return '今日上传量已用完'
     elif code == Cloud189.UP_ILLEGAL_ERROR:
         return '文件非法'
+    elif code == Cloud189.DOWN_SPACE_ERROR:
+        return '磁盘空间不足'
+    elif code == Cloud189.DOWN_MD5_ERROR:
+        return '文件校验失败(md5 不一致)'
     else:
         return '未知错误'
 
@@ -139,13 +157,15 @@ def text_align(text, length) -> str:
     return text + ' ' * space
 
 
-def parsing_up_params(arg: str, follow, force, mkdir) -> (bool, bool, bool, bool):
+def parsing_up_params(arg: str, follow, force, mkdir, workers, pack) -> (bool, bool, bool, int, int, bool):
     """解析文件上传参数
     :param str arg: 解析参数
     :param bool follow: 实时任务
     :param bool force: 强制上传
     :param bool mkdir: 不创建父文件夹
-    :return: follow, force, mkdir, match(标识是否需要删除 arg)
+    :param int workers: 文件夹同时上传的文件数
+    :param int pack: 打包上传，-1 整个文件夹打包，大于 0 时打包不超过该大小的子文件夹，0 不打包
+    :return: follow, force, mkdir, workers, pack, match(标识是否需要删除 arg)
     """
     match = False
     if len(arg) > 1:
@@ -159,6 +179,18 @@ def parsing_up_params(arg: str, follow, force, mkdir) -> (bool, bool, bool, bool
             elif arg == '--nodir':  # 不创建父文件夹
                 mkdir = False
                 match = True
+            elif arg.startswith('--workers=') and arg[10:].isnumeric():  # 同时上传的文件数
+                workers = max(int(arg[10:]), 1)
+                match = True
+            elif arg == '--pack':  # 整个文件夹打包上传
+                pack = -1
+                match = True
+            elif arg.startswith('--pack=') and parse_size_str(arg[7:]) > 0:  # 打包上传小的子文件夹
+                pack = parse_size_str(arg[7:])
+                match = True
+        elif arg.startswith('-w') and arg[2:].isnumeric():
+            workers = max(int(arg[2:]), 1)
+            match = True
         elif arg.startswith('-'):
             for i in arg[1:]:
                 if i == 'f':  # 实时任务
@@ -170,7 +202,39 @@ def parsing_up_params(arg: str, follow, force, mkdir) -> (bool, bool, bool, bool
                 elif i == 'n':  # 不创建父文件夹
                     mkdir = False
                     match = True
-    return follow, force, mkdir, match
+                elif i == 'p':  # 整个文件夹打包上传
+                    pack = -1
+                    match = True
+    return follow, force, mkdir, workers, pack, match
+
+
+def parsing_down_params(arg: str, follow, threads, zip_, extract) -> (bool, int, bool, bool, bool):
+    """解析文件下载参数
+    :param str arg: 解析参数
+    :param bool follow: 实时任务
+    :param int threads: 分段下载连接数
+    :param bool zip_: 文件夹打包下载
+    :param bool extract: 文件夹打包下载，并且边下载边解压
+    :return: follow, threads, zip_, extract, match(标识是否需要删除 arg)
+    """
+    match = False
+    if arg in ('-f', '--follow'):  # 实时任务
+        follow = True
+        match = True
+    elif arg in ('-z', '--zip'):  # 文件夹打包下载
+        zip_ = True
+        match = True
+    elif arg in ('-x', '--extract'):  # 文件夹打包下载，边下载边解压
+        zip_ = True
+        extract = True
+        match = True
+    elif arg.startswith('--threads=') and arg[10:].isnumeric():  # 分段下载连接数
+        threads = max(int(arg[10:]), 1)
+        match = True
+    elif arg.startswith('-t') and arg[2:].isnumeric():
+        threads = max(int(arg[2:]), 1)
+        match = True
+    return follow, threads, zip_, extract, match
 
 
 def handle_name(name: str) -> str:
@@ -291,8 +355,22 @@ def print_help():
     shared      显示已经分享的文件(夹)信息
     clear/c     清空屏幕
     upload/u    上传文件(夹)
-    down/d      下载文件、提取分享链接直链 # TODO: 下载文件夹
+                -w4/--workers=4 文件夹同时上传 4 个文件(默认 3 个)
+                --parts=4 大于 16MB 的文件分 4 个分片并行上传(本次运行有效，默认不分片)
+                -p/--pack 文件夹边读边打包成 tar 上传(适合大量小文件)
+                --pack=64M 不超过 64M 的子文件夹打包成 tar 上传
+                - --name=文件名 从标准输入读取数据上传，如 main.py upload - --name db.sql.gz
+    down/d      下载文件(夹)、分享链接，如 down 分享链接 [提取码]
+                -t4/--threads=4 使用 4 个连接分段下载
+                -z/--zip 文件夹使用服务器打包下载
+                -x/--extract 文件夹打包下载，边下载边解压，不保存压缩包；
+                             下载 --pack 上传的 .tar 文件时边下载边解包
+    mirror      增量镜像文件夹到本地，只下载新增或变化的文件
+                -n/--dry-run 只显示镜像计划与需要下载的大小
+                -d/--delete 删除远端已经不存在的本地文件
+    cat         输出文件内容到标准输出(管道)，-r起始-[结束] 读取部分字节
     setpath     设置文件下载路径
+    limit       查看、设置全局限速，如 limit up 20M、limit down 0(不限速)
     who/quota   查看当前账户信息
     sign        签到+抽奖
     bye/exit/b  退出本程序